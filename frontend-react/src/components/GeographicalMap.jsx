@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useCallback } from 'react';
 import { RefreshCw } from 'lucide-react';
 import axios from 'axios';
+import useEventStream from '../hooks/useEventStream';
 
 const GeographicalMap = () => {
   const [mapHtml, setMapHtml] = useState('');
@@ -59,11 +60,8 @@ const GeographicalMap = () => {
     fetchMapData();
   }, []);
 
-  // Auto-actualización cada 5 minutos
-  useEffect(() => {
-    const interval = setInterval(() => handleRefresh(false), 300000);
-    return () => clearInterval(interval);
-  }, [handleRefresh]);
+  // Actualización en vivo: redibujar como máximo cada minuto cuando aparecen nuevas IPs SSH
+  useEventStream(['ssh_attack', 'ssh_success'], () => handleRefresh(false), 60000);
 
   // Recargar mapa cuando cambien los filtros
   useEffect(() => {
@@ -1,5 +1,6 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useCallback } from 'react';
 import { Users, Database, UserCheck, UserX, RefreshCw, Activity, Globe } from 'lucide-react';
+import useEventStream from '../hooks/useEventStream';
 
 const OpenProjectSection = ({ data, onRefresh }) => {
   const [refreshing, setRefreshing] = useState(false);
@@ -20,11 +21,8 @@ const OpenProjectSection = ({ data, onRefresh }) => {
     setTimeout(() => setRefreshing(false), 500);
   }, [onRefresh]);
 
-  // Auto-actualización cada 5 minutos
-  useEffect(() => {
-    const interval = setInterval(() => handleRefresh(false), 300000);
-    return () => clearInterval(interval);
-  }, [handleRefresh]);
+  // Actualización en vivo: solo cuando hay nuevos intentos fallidos en OpenProject
+  useEventStream(['op_failed_login'], () => handleRefresh(false), 10000);
 
   return (
     <div className={`bg-white dark:bg-gray-800 rounded-lg shadow-sm border border-gray-200 dark:border-gray-700 transition-all duration-500 ${refreshing ? 'ring-2 ring-blue-300 dark:ring-blue-500' : ''}`}>
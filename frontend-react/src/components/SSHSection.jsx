@@ -1,5 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import { Shield, RefreshCw, Lock, CheckCircle, User, Terminal, Clock, Globe } from 'lucide-react';
+import useEventStream from '../hooks/useEventStream';
 
 const SSHSection = ({ data, onRefresh }) => {
   const [refreshing, setRefreshing] = useState(false);
@@ -11,11 +12,12 @@ const SSHSection = ({ data, onRefresh }) => {
     setTimeout(() => setRefreshing(false), 500);
   };
 
-  // Auto-actualización cada 5 minutos
-  useEffect(() => {
-    const interval = setInterval(() => handleRefresh(false), 300000);
-    return () => clearInterval(interval);
-  }, [onRefresh]);
+  // Actualización en vivo: solo cuando llegan ataques, logins, baneos o cambian las sesiones
+  useEventStream(
+    ['ssh_attack', 'ssh_success', 'f2b_ban', 'f2b_unban', 'ssh_sessions'],
+    () => handleRefresh(false),
+    10000
+  );
 
   return (
     <div className={`bg-white dark:bg-gray-800 rounded-lg shadow-sm border border-gray-200 dark:border-gray-700 transition-all duration-500 ${refreshing ? 'ring-2 ring-blue-300 dark:ring-blue-500' : ''}`}>
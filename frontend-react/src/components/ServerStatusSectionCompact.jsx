@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import useEventStream from '../hooks/useEventStream';
 import { 
   Server, 
   Activity, 
@@ -78,10 +79,20 @@ const ServerStatusSectionCompact = ({ onRefresh }) => {
 
   useEffect(() => {
     fetchServerStatus(true); // Carga inicial con loading
-    const interval = setInterval(() => fetchServerStatus(false), 300000); // Actualizaciones cada 5 minutos
-    return () => clearInterval(interval);
   }, []);
 
+  // Actualización en vivo: el backend envía cada muestra nueva del estado del servidor
+  useEventStream(['server_status'], (eventName, data) => {
+    if (eventName === 'resync') {
+      fetchServerStatus(false);
+      return;
+    }
+    setIsUpdating(true);
+    setServerData(data);
+    setError(null);
+    setTimeout(() => setIsUpdating(false), 500);
+  });
+
   if (loading) {
     return (
       <div className="bg-white dark:bg-gray-800 p-6 rounded-lg shadow transition-colors duration-200">
@@ -206,7 +217,11 @@ const ServerStatusSectionCompact = ({ onRefresh }) => {
                   }`}></div>
                   <span className="text-sm text-gray-700 dark:text-gray-300">{container.name}</span>
                 </div>
-                <span className="text-xs text-gray-500 dark:text-gray-400">{container.status}</span>
+                <span className="text-xs text-gray-500 dark:text-gray-400">
+                  {container.health ? `${container.status} (${container.health})` : container.status}
+                  {container.cpu != null && ` · CPU ${container.cpu}%`}
+                  {container.memory_percent != null && ` · RAM ${container.memory_percent}%`}
+                </span>
               </div>
             ))}
             <div className="border-t border-gray-200 dark:border-gray-600 pt-2 mt-3">
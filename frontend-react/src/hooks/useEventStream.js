@@ -0,0 +1,71 @@
+import { useEffect, useRef } from 'react';
+
+// Configuración inteligente de API URL (igual que en Dashboard)
+const STREAM_URL = window.location.hostname === 'localhost'
+  ? 'http://45.137.194.210:8091/api/stream'
+  : `http://${window.location.hostname}:8091/api/stream`;
+
+// Una sola conexión EventSource compartida por todas las secciones.
+// El navegador reconecta solo y envía Last-Event-ID para reanudar sin perder eventos.
+let source = null;
+let subscribers = 0;
+
+const acquireSource = () => {
+  if (!source) {
+    source = new EventSource(STREAM_URL);
+  }
+  subscribers += 1;
+  return source;
+};
+
+const releaseSource = () => {
+  subscribers -= 1;
+  if (subscribers === 0 && source) {
+    source.close();
+    source = null;
+  }
+};
+
+/**
+ * Suscribe un componente a eventos de /api/stream.
+ *
+ * handler(eventName, data) se llama como máximo una vez cada `throttleMs`
+ * (la última llamada de una ráfaga siempre se entrega). El evento `resync`
+ * (cliente demasiado atrasado) se entrega a todos los suscriptores.
+ */
+const useEventStream = (eventNames, handler, throttleMs = 0) => {
+  const handlerRef = useRef(handler);
+  handlerRef.current = handler;
+
+  useEffect(() => {
+    const stream = acquireSource();
+    let lastCall = 0;
+    let pending = null;
+
+    const listener = (message) => {
+      const data = message.data ? JSON.parse(message.data) : null;
+      const deliver = () => {
+        lastCall = Date.now();
+        pending = null;
+        handlerRef.current(message.type, data);
+      };
+      const wait = throttleMs - (Date.now() - lastCall);
+      if (wait <= 0) {
+        deliver();
+      } else {
+        clearTimeout(pending);
+        pending = setTimeout(deliver, wait);
+      }
+    };
+
+    const names = [...eventNames, 'resync'];
+    names.forEach((name) => stream.addEventListener(name, listener));
+    return () => {
+      clearTimeout(pending);
+      names.forEach((name) => stream.removeEventListener(name, listener));
+      releaseSource();
+    };
+  }, [eventNames.join(','), throttleMs]); // eslint-disable-line react-hooks/exhaustive-deps
+};
+
+export default useEventStream;
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass /proc/net/tcp scan vs the old netstat|grep pipelines.
+
+The previous implementation spawned `netstat -tn | grep ':PORT ' | grep ESTABLISHED`
+once per SSH port (22, 2234, 2222, 22222) and once per web port (80, 443):
+six shell pipelines per refresh. scan_tcp_connections() classifies all of
+them in one read of /proc/net/tcp and /proc/net/tcp6.
+
+Usage: python3 scripts/benchmark_connections.py [iterations]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_openproject_monitor import SSH_PORTS, WEB_PORTS, scan_tcp_connections
+
+WATCHED_PORTS = SSH_PORTS + list(WEB_PORTS)
+
+
+def netstat_refresh():
+    """One refresh as done before: six netstat|grep pipelines"""
+    lines = []
+    for port in WATCHED_PORTS:
+        result = subprocess.run(f"netstat -tn | grep ':{port} ' | grep ESTABLISHED",
+                                shell=True, capture_output=True, text=True, timeout=30)
+        lines.extend(l for l in result.stdout.split('\n') if l.strip())
+    return lines
+
+
+def proc_refresh():
+    """One refresh with the single-pass scanner"""
+    return scan_tcp_connections(WATCHED_PORTS)
+
+
+def bench(name, func, iterations):
+    func()  # Warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - started
+    per_call_ms = elapsed / iterations * 1000
+    print(f"{name:<28} {iterations:>6} refreshes  {per_call_ms:>9.3f} ms/refresh")
+    return per_call_ms
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    connections = proc_refresh()
+    total = sum(len(c) for c in connections.values())
+    print(f"Watched ports: {', '.join(str(p) for p in WATCHED_PORTS)} ({total} established connections)")
+    print("=" * 64)
+
+    proc_ms = bench("/proc/net/tcp single pass", proc_refresh, iterations)
+
+    if shutil.which('netstat'):
+        netstat_ms = bench("netstat|grep x6 (previous)", netstat_refresh, max(iterations // 10, 1))
+        print("=" * 64)
+        print(f"Speedup: {netstat_ms / proc_ms:.1f}x")
+    else:
+        print("netstat not installed: skipping the subprocess baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sshd journal message parser throughput (lines per second).
+
+Builds a synthetic corpus modelled on scripts/simulate_ssh_attacks.sh (same
+attacker IPs and usernames, failed password / invalid user / connection
+closed [preauth] attacks) mixed with successful logins, disconnects and
+unrelated sshd noise, then runs it through parse_ssh_line() and through the
+previous substring + uncompiled re.search parser for comparison.
+
+Usage: python3 scripts/benchmark_sshd_parser.py [lines]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_openproject_monitor import parse_ssh_line
+
+ATTACKER_IPS = [
+    "103.41.124.45", "185.220.101.182", "91.240.118.172", "177.54.144.89", "196.200.54.123",
+    "103.92.114.45", "185.234.218.123", "41.230.62.211", "200.115.53.198", "94.156.174.23",
+]
+ATTACK_USERS = [
+    "admin", "root", "user", "test", "guest", "administrator", "postgres", "mysql",
+    "oracle", "backup", "ftpuser", "www-data", "nginx", "apache", "jenkins",
+]
+TRUSTED_IPS = ["142.111.25.137", "190.205.115.82"]
+
+
+def build_corpus(size, seed=42):
+    """Generate `size` sshd messages with a realistic attack-heavy mix"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        ip = rng.choice(ATTACKER_IPS)
+        user = rng.choice(ATTACK_USERS)
+        port = rng.randint(40000, 65000)
+        kind = rng.random()
+        if kind < 0.30:
+            corpus.append(f"Failed password for {user} from {ip} port {port} ssh2")
+        elif kind < 0.50:
+            corpus.append(f"Invalid user {user} from {ip} port {port}")
+        elif kind < 0.60:
+            corpus.append(f"Failed password for invalid user {user} from {ip} port {port} ssh2")
+        elif kind < 0.80:
+            corpus.append(f"Connection closed by {ip} port {port} [preauth]")
+        elif kind < 0.85:
+            corpus.append(f"Disconnected from invalid user {user} {ip} port {port} [preauth]")
+        elif kind < 0.90:
+            trusted = rng.choice(TRUSTED_IPS)
+            corpus.append(f"Accepted publickey for root from {trusted} port {port} ssh2: ED25519 SHA256:abc")
+        else:
+            corpus.append("pam_unix(sshd:session): session closed for user root")
+    return corpus
+
+
+def legacy_parse(line, epoch):
+    """Parser used before the precompiled pattern table (kept for comparison)"""
+    if 'Failed password' in line or 'Invalid user' in line:
+        match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
+        if match:
+            user_match = re.search(r'user (\w+)', line) or re.search(r'for (\w+)', line)
+            timestamp_match = re.search(r'(\w{3} \d{1,2} \d{2}:\d{2}:\d{2})', line)
+            return {'type': 'attack', 'ip': match.group(1),
+                    'user': user_match.group(1) if user_match else 'unknown',
+                    'timestamp': timestamp_match.group(1) if timestamp_match else 'unknown', 'raw': line}
+    elif 'Accepted' in line and ('password' in line or 'publickey' in line):
+        match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
+        if match:
+            user_match = re.search(r'for (\w+)', line)
+            timestamp_match = re.search(r'(\w{3} \d{1,2} \d{2}:\d{2}:\d{2})', line)
+            return {'type': 'success', 'ip': match.group(1),
+                    'user': user_match.group(1) if user_match else 'unknown',
+                    'auth_type': 'publickey' if 'publickey' in line else 'password',
+                    'timestamp': timestamp_match.group(1) if timestamp_match else 'unknown', 'raw': line}
+    return None
+
+
+def bench(name, func, corpus, lines_per_second=20):
+    # Journal timestamps advance as in a sustained attack (~20 lines/s)
+    epochs = [time.time() + i / lines_per_second for i in range(len(corpus))]
+    started = time.perf_counter()
+    parsed = 0
+    for line, epoch in zip(corpus, epochs):
+        if func(line, epoch) is not None:
+            parsed += 1
+    elapsed = time.perf_counter() - started
+    rate = len(corpus) / elapsed
+    print(f"{name:<26} {rate:>12,.0f} lines/s  ({parsed:,} events from {len(corpus):,} lines)")
+    return rate
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    corpus = build_corpus(size)
+    print("=" * 72)
+    new_rate = bench("parse_ssh_line", parse_ssh_line, corpus)
+    old_rate = bench("legacy re.search parser", legacy_parse, corpus)
+    print("=" * 72)
+    print(f"Speedup: {new_rate / old_rate:.2f}x (the new parser also extracts port, auth method,")
+    print("epoch and disconnect/preauth events that the legacy parser ignored)")
+
+
+if __name__ == '__main__':
+    main()
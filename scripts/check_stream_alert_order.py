@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Check: a batch of failed logins that raises an intrusion alert is still
+streamed in full over /api/stream.
+
+The brute-force detector stores its alert from inside the event store
+listener chain. The alert gets a higher id than the batch that raised it,
+so it must reach SSE clients after that batch; otherwise the client's
+"already delivered" id filter drops the attacks. Runs against a temporary
+event store and exits non-zero if any event is missing or out of order.
+
+Usage: python3 scripts/check_stream_alert_order.py [attacks]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_openproject_monitor import BURST_THRESHOLD, BruteForceDetector, EventStore, EventStream
+
+
+class NoCollectors:
+    """Stands in for the collector scheduler: this check only streams stored events"""
+
+    def subscribe(self, callback):
+        pass
+
+
+def main():
+    attacks = int(sys.argv[1]) if len(sys.argv) > 1 else BURST_THRESHOLD + 5
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EventStore(os.path.join(tmp, 'events.db'))
+        BruteForceDetector(store)  # Subscribed before the stream, as in the monitor
+        stream = EventStream(store, NoCollectors())
+        messages = stream.stream()  # A fresh client: stored events reach it only through the live broadcast
+        delivered = []
+
+        def consume():
+            for message in messages:
+                if message.startswith(':'):
+                    return  # Keepalive: nothing more is queued for this client
+                fields = dict(line.split(': ', 1) for line in message.strip().splitlines() if ': ' in line)
+                if 'id' in fields:
+                    delivered.append((int(fields['id']), fields.get('event')))
+
+        consumer = threading.Thread(target=consume, daemon=True)
+        consumer.start()
+        time.sleep(0.5)  # Let the client connect and wait on its queue
+
+        now = time.time()
+        store.add_events([{'ts': now + i * 0.1, 'event_type': 'ssh_attack', 'source': 'ssh', 'ip': '203.0.113.7',
+                           'user': 'root', 'country': None, 'data': {'ip': '203.0.113.7', 'user': 'root'}}
+                          for i in range(attacks)])
+        expected = [event['id'] for event in store.query_events(after_id=0, limit=attacks + 10, order_by_id=True)]
+        deadline = time.time() + 5
+        while len(delivered) < len(expected) and time.time() < deadline:
+            time.sleep(0.05)
+
+    ids = [event_id for event_id, _ in delivered]
+    alerts = sum(1 for _, name in delivered if name == 'intrusion_alert')
+    print(f"stored {len(expected)} events ({attacks} attacks), streamed {len(ids)}, alerts {alerts}")
+    if ids != expected or not alerts:
+        print(f"FAIL: expected ids {expected}, streamed {ids}")
+        return 1
+    print("OK: the alert follows the attacks that raised it")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
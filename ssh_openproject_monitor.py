@@ -4,18 +4,44 @@ import subprocess
 import json
 import logging
 import socket
+import ipaddress
+import http.client
+import urllib.parse
 import psutil
 import shutil
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+import sqlite3
+from array import array
+import gzip
+import queue
+import hashlib
+import math
+import zlib
+import base64
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, g, has_request_context, jsonify, request
 from flask_cors import CORS
 import geoip2.database
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:  # Optional: OpenProject DB queries fall back to `docker exec op_db psql`
+    psycopg2 = None
+try:
+    import brotli
+except ImportError:  # Optional: responses are gzip-compressed only
+    brotli = None
 import folium
 import os
-from collections import defaultdict, Counter
+import threading
+import time
+from collections import defaultdict, Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 
 app = Flask(__name__)
-CORS(app)  # Habilitar CORS para permitir peticiones desde React
+CORS(app, expose_headers=['X-Next-Cursor'])  # Habilitar CORS para permitir peticiones desde React
 
 # Configure logging
 logging.basicConfig(
@@ -27,181 +53,1370 @@ logging.basicConfig(
     ]
 )
 
+TRUSTED_IPS_PATH = '/opt/ssh-monitor/trusted_ips.json'
+TRUSTED_IPS_CHECK_INTERVAL = 2  # Seconds between mtime checks of the trusted IPs file
+
+class PrefixTrie:
+    """Binary trie of IPv4/IPv6 networks: longest-prefix match in O(prefix length)"""
+
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}  # node: [child0, child1, value]
+
+    def insert(self, network, value):
+        node = self.roots[network.version]
+        address = int(network.network_address)
+        for i in range(network.prefixlen):
+            bit = (address >> (network.max_prefixlen - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = value
+
+    def lookup(self, address):
+        """Value of the longest network containing `address` (None if no match)"""
+        node = self.roots[address.version]
+        match = node[2]
+        value = int(address)
+        for i in range(address.max_prefixlen - 1, -1, -1):
+            node = node[(value >> i) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                match = node[2]
+        return match
+
+class TrustedIPRegistry:
+    """In-memory view of trusted_ips.json, re-parsed only when the file's mtime changes.
+
+    Entries of both `ips` and `trusted_ips[].ip` may be single addresses or
+    CIDR ranges (IPv4 or IPv6); non-address names such as 'localhost' are
+    matched exactly. Removing the file empties the registry; an invalid file
+    keeps the previous one.
+    """
+
+    def __init__(self, path=TRUSTED_IPS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.checked_at = 0
+        self.data = {}
+        self.trie = PrefixTrie()
+        self.names = {}
+
+    def _refresh(self):
+        now = time.time()
+        if now - self.checked_at < TRUSTED_IPS_CHECK_INTERVAL:
+            return
+        with self.lock:
+            if now - self.checked_at < TRUSTED_IPS_CHECK_INTERVAL:
+                return
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamp = None
+            if stamp == self.stamp:
+                return
+            self.stamp = stamp
+            if stamp is None:
+                # Removed file: nothing is trusted any more, as when it never existed
+                self._build({})
+                logging.info(f"Trusted IPs file {self.path} not found: registry cleared")
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except Exception as e:
+                # An unreadable or invalid file keeps the previous registry until the file changes again
+                logging.error(f"Error loading trusted IPs from {self.path}: {e}")
+                return
+            self._build(data)
+            logging.info(f"Trusted IPs loaded: {len(data.get('ips', []))} addresses, "
+                         f"{len(data.get('trusted_ips', []))} annotated entries")
+
+    def _build(self, data):
+        trie, names = PrefixTrie(), {}
+        entries = [{'ip': ip} for ip in data.get('ips', [])] + list(data.get('trusted_ips', []))
+        for entry in entries:
+            try:
+                trie.insert(ipaddress.ip_network(entry['ip'], strict=False), entry)
+            except (KeyError, ValueError):
+                if entry.get('ip'):
+                    names[entry['ip']] = entry
+        self.data, self.trie, self.names = data, trie, names
+
+    def get(self):
+        """Parsed trusted_ips.json (treat as read-only)"""
+        self._refresh()
+        return self.data
+
+    def match(self, ip):
+        """Most specific trusted entry covering `ip` (None if not trusted)"""
+        self._refresh()
+        if not ip:
+            return None
+        if ip in self.names:
+            return self.names[ip]
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return self.trie.lookup(address)
+
+    def is_trusted(self, ip):
+        return self.match(ip) is not None
+
+trusted_registry = TrustedIPRegistry()
+
 def load_trusted_ips():
-    """Load trusted IPs from JSON file"""
+    """Load trusted IPs from JSON file (cached; re-read only when it changes)"""
+    return trusted_registry.get()
+
+GEOIP_DB_PATH = '/opt/ssh-monitor/GeoLite2-City.mmdb'
+GEOIP_CACHE_SIZE = 4096       # Enriched IPs kept in memory
+GEOIP_CACHE_TTL = 6 * 3600    # Seconds before a cached lookup is refreshed
+GEOIP_RETRY_SECONDS = 60      # Wait before retrying a database that failed to open
+
+# One reader for the whole process: the .mmdb is memory-mapped once and shared
+# by every thread (geoip2 readers are thread-safe for lookups).
+_geoip_reader = None
+_geoip_reader_failed_at = 0.0
+_geoip_lock = threading.Lock()
+
+# LRU of ip -> (expires_at, geo_info), guarded by _geoip_lock
+_geo_cache = OrderedDict()
+_geo_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _get_geoip_reader():
+    """Return the shared GeoIP reader, opening it on first use"""
+    global _geoip_reader, _geoip_reader_failed_at
+    if _geoip_reader is not None:
+        return _geoip_reader
+    with _geoip_lock:
+        if _geoip_reader is None and time.time() - _geoip_reader_failed_at >= GEOIP_RETRY_SECONDS:
+            try:
+                _geoip_reader = geoip2.database.Reader(GEOIP_DB_PATH, mode=geoip2.database.MODE_MMAP)
+                logging.info(f"GeoIP database opened (mmap): {GEOIP_DB_PATH}")
+            except Exception as e:
+                _geoip_reader_failed_at = time.time()
+                logging.error(f"Error opening GeoIP database: {e}")
+    return _geoip_reader
+
+def _lookup_geo_info(ip):
+    """Resolve an IP against the GeoIP database (uncached)"""
+    if ip in ['127.0.0.1', 'localhost', '::1']:
+        return {'country': 'Local', 'city': 'localhost', 'lat': 0, 'lon': 0}
     try:
-        with open('/opt/ssh-monitor/trusted_ips.json', 'r') as f:
-            return json.load(f)
+        reader = _get_geoip_reader()
+        if reader is None:
+            return {'country': 'Unknown', 'city': 'Unknown', 'lat': 0, 'lon': 0}
+        response = reader.city(ip)
+        return {
+            'country': response.country.name or 'Unknown',
+            'city': response.city.name or 'Unknown',
+            'lat': float(response.location.latitude or 0),
+            'lon': float(response.location.longitude or 0)
+        }
     except:
-        return {}
+        return {'country': 'Unknown', 'city': 'Unknown', 'lat': 0, 'lon': 0}
+
+def get_geo_info_batch(ips):
+    """Get geographical information for many IPs: one cache pass, then look up only the misses"""
+    now = time.time()
+    result, misses = {}, []
+    with _geoip_lock:
+        for ip in set(ips):
+            cached = _geo_cache.get(ip)
+            if cached is not None and cached[0] > now:
+                _geo_cache.move_to_end(ip)
+                _geo_cache_stats['hits'] += 1
+                result[ip] = dict(cached[1])
+            else:
+                _geo_cache_stats['misses'] += 1
+                misses.append(ip)
+
+    resolved = {ip: _lookup_geo_info(ip) for ip in misses}
+    result.update({ip: dict(geo_info) for ip, geo_info in resolved.items()})
+    if _geoip_reader is None:
+        # Database not available yet: don't pin 'Unknown' results for a whole TTL
+        return result
+
+    with _geoip_lock:
+        for ip, geo_info in resolved.items():
+            _geo_cache[ip] = (now + GEOIP_CACHE_TTL, geo_info)
+            _geo_cache.move_to_end(ip)
+        while len(_geo_cache) > GEOIP_CACHE_SIZE:
+            _geo_cache.popitem(last=False)
+            _geo_cache_stats['evictions'] += 1
+    return result
 
 def get_geo_info(ip):
-    """Get geographical information for an IP address"""
+    """Get geographical information for an IP address (LRU/TTL cached)"""
+    return get_geo_info_batch([ip])[ip]
+
+def get_geo_cache_stats():
+    """Get hit/miss counters for the GeoIP enrichment cache"""
+    with _geoip_lock:
+        stats = dict(_geo_cache_stats)
+        stats['size'] = len(_geo_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['max_size'] = GEOIP_CACHE_SIZE
+    stats['ttl_seconds'] = GEOIP_CACHE_TTL
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['reader_open'] = _geoip_reader is not None
+    return stats
+
+UNKNOWN_IP_INFO = {'country': 'Unknown', 'city': 'Unknown', 'lat': 0, 'lon': 0, 'is_trusted': False}
+
+def _enrich_geo(ips):
+    return get_geo_info_batch(ips)
+
+def _enrich_trusted(ips):
+    return {ip: {'is_trusted': trusted_registry.is_trusted(ip)} for ip in ips}
+
+# Enrichment stages: each maps a set of distinct IPs to {ip: {field: value}}
+IP_ENRICHERS = [_enrich_geo, _enrich_trusted]
+
+def enrich_ips(ips):
+    """Resolve every distinct IP once through all enrichment stages"""
+    distinct = {ip for ip in ips if ip and ip != 'unknown'}
+    info = {ip: dict(UNKNOWN_IP_INFO) for ip in distinct}
+    for enricher in IP_ENRICHERS:
+        for ip, fields in enricher(distinct).items():
+            info[ip].update(fields)
+    return info
+
+def enrich_events(events, fields=('country', 'is_trusted'), ip_key='ip'):
+    """Join batch-resolved IP information onto events (returns new dicts)"""
+    info = enrich_ips(event.get(ip_key) for event in events)
+    return [
+        {**event, **{field: info.get(event.get(ip_key), UNKNOWN_IP_INFO)[field] for field in fields}}
+        for event in events
+    ]
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of durations (microsecond resolution).
+
+    Each power-of-two range is split into 2**sub_bits linear buckets, so any
+    recorded value is reported within ~1/2**(sub_bits+1) relative error with a
+    bounded number of buckets whatever the spread of latencies.
+    """
+
+    def __init__(self, sub_bits=4):
+        self.sub_bits = sub_bits
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def _index(self, micros):
+        magnitude = max(micros.bit_length() - self.sub_bits - 1, 0)
+        return magnitude, micros >> magnitude
+
+    def record(self, seconds):
+        index = self._index(max(int(seconds * 1e6), 0))
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.min = seconds if self.min is None else min(self.min, seconds)
+
+    def percentile(self, q):
+        """Approximate q-th percentile in seconds (midpoint of the bucket holding it)"""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for magnitude, value in sorted(self.buckets):
+                seen += self.buckets[(magnitude, value)]
+                if seen >= rank:
+                    low = value << magnitude
+                    return min((low + ((1 << magnitude) - 1) / 2) / 1e6, self.max)
+            return self.max
+
+    def summary(self):
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        with self.lock:
+            count, total, low, high = self.count, self.total, self.min, self.max
+        rounded = lambda v: round(v, 6) if v is not None else None
+        return {'count': count, 'mean': rounded(total / count if count else None), 'min': rounded(low),
+                'p50': rounded(p50), 'p95': rounded(p95), 'p99': rounded(p99), 'max': rounded(high if count else None)}
+
+class CallStats:
+    """Timing, exit codes, timeouts and output sizes of one kind of external call"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.exit_codes = Counter()
+        self.output_bytes = 0
+        self.last_output_bytes = 0
+
+    def record(self, seconds, exit_code=None, output_bytes=0, timed_out=False, error=False):
+        self.latency.record(seconds)
+        with self.lock:
+            self.calls += 1
+            self.timeouts += timed_out
+            self.errors += error
+            # Calls that never returned are counted under 'timeout' / 'error' instead of an exit code
+            self.exit_codes['timeout' if timed_out else 'error' if error else exit_code] += 1
+            self.output_bytes += output_bytes
+            self.last_output_bytes = output_bytes
+
+    def summary(self):
+        with self.lock:
+            stats = {'calls': self.calls, 'timeouts': self.timeouts, 'errors': self.errors,
+                     'exit_codes': {str(code): n for code, n in self.exit_codes.items()},
+                     'output_bytes': self.output_bytes, 'last_output_bytes': self.last_output_bytes}
+        stats['latency'] = self.latency.summary()
+        return stats
+
+call_stats = defaultdict(CallStats)  # label -> CallStats ('journalctl', 'docker exec', 'postgres ...', ...)
+
+def _command_label(command):
+    """'docker exec op_db psql ...' -> 'docker exec'; 'journalctl --no-pager ...' -> 'journalctl'"""
+    args = command.split() if isinstance(command, str) else list(command)
+    if not args:
+        return 'unknown'
+    program = os.path.basename(args[0])
+    if len(args) > 1 and re.fullmatch(r'[a-z][a-z0-9-]*', args[1]):
+        return f"{program} {args[1]}"
+    return program
+
+def timed_run(command, **kwargs):
+    """subprocess.run() that records latency, exit code, timeouts and output bytes per command"""
+    stats = call_stats[_command_label(command)]
+    started = time.perf_counter()
     try:
-        if ip in ['127.0.0.1', 'localhost', '::1']:
-            return {'country': 'Local', 'city': 'localhost', 'lat': 0, 'lon': 0}
-        
-        with geoip2.database.Reader('/opt/ssh-monitor/GeoLite2-City.mmdb') as reader:
-            response = reader.city(ip)
-            return {
-                'country': response.country.name or 'Unknown',
-                'city': response.city.name or 'Unknown',
-                'lat': float(response.location.latitude or 0),
-                'lon': float(response.location.longitude or 0)
-            }
-    except:
-        return {'country': 'Unknown', 'city': 'Unknown', 'lat': 0, 'lon': 0}
+        result = subprocess.run(command, **kwargs)
+    except subprocess.TimeoutExpired:
+        stats.record(time.perf_counter() - started, timed_out=True)
+        raise
+    except OSError:
+        stats.record(time.perf_counter() - started, error=True)
+        raise
+    output_bytes = sum(len(out) for out in (result.stdout, result.stderr) if out)
+    stats.record(time.perf_counter() - started, exit_code=result.returncode, output_bytes=output_bytes)
+    return result
 
 def run_command(command):
     """Execute a shell command and return output"""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=30)
+        # errors='replace': log lines with attacker-supplied bytes must not raise UnicodeDecodeError
+        result = timed_run(command, shell=True, capture_output=True, text=True, errors='replace', timeout=30)
         return result.stdout.strip()
-    except:
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Command timed out after 30s: {command}")
         return ""
+    except OSError as e:
+        logging.warning(f"Command failed: {command}: {e}")
+        return ""
+
+EVENT_STORE_PATH = '/opt/ssh-monitor/events.db'
+EVENT_STORE_RETENTION_DAYS = 90
+
+SSH_EVENT_TYPES = {'attack': 'ssh_attack', 'success': 'ssh_success', 'disconnect': 'ssh_disconnect'}
+
+class EventStore:
+    """Local SQLite (WAL) store of parsed security events.
+
+    Collectors write every parsed SSH, OpenProject and fail2ban event here
+    once; endpoints answer with indexed range queries instead of re-reading
+    raw logs, so windows of 7 or 30 days stay affordable. Each thread gets its
+    own connection (WAL lets readers run while the single writer commits).
+    Subscribers registered with subscribe() receive every batch after commit.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            event_type TEXT NOT NULL,
+            source TEXT NOT NULL,
+            ip TEXT,
+            user TEXT,
+            country TEXT,
+            data TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)",
+        "CREATE INDEX IF NOT EXISTS idx_events_ip_ts ON events (ip, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (event_type, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_ts ON events (user, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_events_country_ts ON events (country, ts)",
+    ]
+
+    def __init__(self, path=EVENT_STORE_PATH, retention_days=EVENT_STORE_RETENTION_DAYS):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.listeners = []
+        self.schema_ready = False
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self.schema_ready:
+                with self.write_lock:
+                    for statement in self.SCHEMA:
+                        conn.execute(statement)
+                    conn.commit()
+                    self.schema_ready = True
+            self.local.conn = conn
+        return conn
+
+    def subscribe(self, callback):
+        """Call callback(events) with every batch of newly stored events"""
+        self.listeners.append(callback)
+
+    def add_events(self, events):
+        """Insert a batch of events ({'ts', 'event_type', 'source', 'ip', 'user', 'data'})"""
+        if not events:
+            return []
+        # One geo pass per distinct IP of the batch for the events that arrive without a country
+        geo = get_geo_info_batch({event.get('ip') for event in events
+                                  if 'country' not in event and event.get('ip') not in (None, '', 'unknown')})
+        rows = []
+        for event in events:
+            ip = event.get('ip')
+            if 'country' not in event:
+                event['country'] = geo[ip]['country'] if ip in geo else None
+            rows.append((event['ts'], event['event_type'], event['source'], ip, event.get('user'),
+                         event['country'], json.dumps(event['data'], default=str)))
+        conn = self._connect()
+        with self.write_lock:
+            conn.executemany(
+                "INSERT INTO events (ts, event_type, source, ip, user, country, data) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+            # rowids of one executemany batch are consecutive under the write lock
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        for offset, event in enumerate(events):
+            event['id'] = last_id - len(events) + 1 + offset
+        self._notify(events)
+        return events
+
+    def _notify(self, events):
+        """Hand a stored batch to every listener, in id order per thread.
+
+        A batch stored by a listener (e.g. detector alerts) is queued and only
+        delivered once every listener has seen the batch that produced it, so
+        no listener receives an id before the lower ids of the outer batch.
+        """
+        pending = getattr(self.local, 'pending', None)
+        if pending is not None:
+            pending.append(events)
+            return
+        self.local.pending = pending = deque([events])
+        try:
+            while pending:
+                batch = pending.popleft()
+                for callback in self.listeners:
+                    try:
+                        callback(batch)
+                    except Exception as e:
+                        logging.error(f"Event store listener failed: {e}")
+        finally:
+            self.local.pending = None
+
+    @staticmethod
+    def _filters(since=None, until=None, event_types=None, ip=None, user=None, country=None, data_filters=None,
+                 after_id=None):
+        """WHERE clauses and parameters shared by query_events() and page_events()"""
+        clauses, params = [], []
+        if after_id is not None:
+            clauses.append("id > ?")
+            params.append(after_id)
+        if event_types:
+            # Unary + keeps the planner on the (ip|user|country, ts) index when one of those is filtered
+            column = '+event_type' if ip or user or country else 'event_type'
+            clauses.append(f"{column} IN ({', '.join('?' * len(event_types))})")
+            params.extend(event_types)
+        for column, value in (('ip', ip), ('user', user), ('country', country)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        # Fields only present in the JSON payload (e.g. HTTP status): applied after the indexed filters
+        for field, value in (data_filters or {}).items():
+            clauses.append("CAST(json_extract(data, ?) AS TEXT) = ?")
+            params.extend([f"$.{field}", str(value)])
+        return clauses, params
+
+    @staticmethod
+    def _row_event(row):
+        event = json.loads(row['data'])
+        event['id'] = row['id']
+        event['event_type'] = row['event_type']
+        if row['country'] is not None:
+            event.setdefault('country', row['country'])
+        return event
+
+    def query_events(self, since=None, until=None, event_types=None, ip=None, limit=None, newest_first=False,
+                     after_id=None, order_by_id=False):
+        """Indexed range query; returns the stored `data` dicts (plus id/event_type/country).
+
+        Rows are in event time order unless `order_by_id` is set: insertion
+        order, which is what resuming from an id (SSE Last-Event-ID) needs
+        since backfilled events can carry older timestamps than newer rows.
+        """
+        clauses, params = self._filters(since, until, event_types, ip, after_id=after_id)
+        sql = "SELECT id, event_type, country, data FROM events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by_id:
+            sql += " ORDER BY id"
+        else:
+            sql += " ORDER BY ts DESC, id DESC" if newest_first else " ORDER BY ts, id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [self._row_event(row) for row in self._connect().execute(sql, params)]
+
+    def page_events(self, limit, before=None, **filters):
+        """One page of matching events, walking back in time.
+
+        `before` is the (ts, id) key the previous page ended at (exclusive),
+        so each page is a keyset range scan rather than an OFFSET. Returns
+        (events oldest first, key to pass as `before` for the next page or
+        None when there are no older matches).
+        """
+        clauses, params = self._filters(**filters)
+        if before is not None:
+            clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        sql = "SELECT id, ts, event_type, country, data FROM events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(int(limit) + 1)
+        rows = self._connect().execute(sql, params).fetchall()
+        next_key = (rows[limit - 1]['ts'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return [self._row_event(row) for row in reversed(rows[:limit])], next_key
+
+    def iter_rows(self, batch_size=5000, **filters):
+        """Yield matching raw rows oldest first, one keyset batch per query.
+
+        Memory stays at one batch however long the range is, and each batch
+        is its own short read so exports never pin a WAL snapshot.
+        """
+        after = None
+        while True:
+            clauses, params = self._filters(**filters)
+            if after is not None:
+                clauses.append("(ts > ? OR (ts = ? AND id > ?))")
+                params.extend([after[0], after[0], after[1]])
+            sql = "SELECT id, ts, event_type, source, ip, user, country, data FROM events"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += " ORDER BY ts, id LIMIT ?"
+            rows = self._connect().execute(sql, params + [batch_size]).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['ts'], rows[-1]['id'])
+
+    def latest_id(self):
+        """Id of the newest stored event (0 if empty)"""
+        return self._connect().execute("SELECT max(id) FROM events").fetchone()[0] or 0
+
+    def latest_ts(self, source):
+        """Timestamp of the newest stored event from a source (None if empty)"""
+        row = self._connect().execute("SELECT max(ts) FROM events WHERE source = ?", (source,)).fetchone()
+        return row[0]
+
+    def active_bans(self):
+        """IPs whose most recent fail2ban event is a ban"""
+        rows = self._connect().execute(
+            """SELECT ip, event_type FROM events WHERE id IN (
+                   SELECT max(id) FROM events WHERE event_type IN ('f2b_ban', 'f2b_unban') GROUP BY ip)""")
+        return {row['ip'] for row in rows if row['event_type'] == 'f2b_ban'}
+
+    def purge(self):
+        """Drop events older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        conn = self._connect()
+        with self.write_lock:
+            deleted = conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+            conn.commit()
+        if deleted:
+            logging.info(f"Event store purged {deleted} events older than {self.retention_seconds // 86400} days")
+        return deleted
+
+event_store = EventStore()
+
+HLL_PRECISION = 11  # 2048 registers: ~2.3% standard error, 2 KB per sketch before compression
+
+class HyperLogLog:
+    """Mergeable HyperLogLog distinct-count sketch with fixed memory"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+
+    @staticmethod
+    def position(value, precision=HLL_PRECISION):
+        """(register index, rank) of a value: hash once, add to many sketches"""
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        rest = h & ((1 << (64 - precision)) - 1)
+        return h >> (64 - precision), (64 - precision) - rest.bit_length() + 1
+
+    def add_position(self, index, rank):
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_position(*self.position(value, self.precision))
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+    @property
+    def relative_error(self):
+        """Standard error of count() (1.04 / sqrt(m))"""
+        return 1.04 / math.sqrt(self.size)
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, blob, precision=HLL_PRECISION):
+        return cls(precision, bytearray(zlib.decompress(blob)))
+
+ROLLUP_GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}  # Finest first; day buckets are UTC days
+ROLLUP_MINUTE_RETENTION_HOURS = 48  # Older windows are answered from hour buckets
+ROLLUP_SKIP_VALUES = {'unknown', 'Unknown'}  # Placeholders that must not count as a distinct value
+
+class RollupStore:
+    """Minute/hour/day rollups of the event store, updated as events are ingested.
+
+    Keeps per-bucket counts per event type plus HyperLogLog sketches of
+    distinct IPs, usernames and countries per bucket and event type, so
+    summaries over any window are a small sum (and sketch merge) over
+    buckets instead of a scan of every event: a 30-day window merges about
+    30 day sketches plus the hours and minutes at its edges, and every
+    sketch has the same fixed size however many attackers it has seen.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS rollup_counts (
+            granularity TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (granularity, bucket, event_type)
+        )""",
+        """CREATE TABLE IF NOT EXISTS rollup_sketches (
+            granularity TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (granularity, bucket, event_type, dimension)
+        )""",
+        "CREATE TABLE IF NOT EXISTS rollup_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ]
+    DIMENSIONS = {'ip': 'ip', 'user': 'user', 'country': 'country'}  # Sketch dimension -> event field
+
+    def __init__(self, store):
+        self.store = store
+        self.schema_ready = False
+        self.setup_lock = threading.Lock()
+        self.rebuilt_through = 0  # Highest event id folded in by rebuild(); listeners fold only newer ones
+
+    def _connect(self):
+        conn = self.store._connect()
+        if self.schema_ready:
+            return conn
+        with self.setup_lock:
+            if self.schema_ready:
+                return conn
+            # Rollups written with other buckets, dimensions or precision are recomputed once
+            layout = json.dumps({'granularities': ROLLUP_GRANULARITIES, 'dimensions': self.DIMENSIONS,
+                                 'precision': HLL_PRECISION}, sort_keys=True)
+            with self.store.write_lock:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                row = conn.execute("SELECT value FROM rollup_meta WHERE key = 'layout'").fetchone()
+                empty = conn.execute("SELECT 1 FROM rollup_counts LIMIT 1").fetchone() is None
+                needs_rebuild = empty or row is None or row[0] != layout
+                if needs_rebuild:
+                    conn.execute("DELETE FROM rollup_counts")
+                    conn.execute("DELETE FROM rollup_sketches")
+                    conn.execute("INSERT OR REPLACE INTO rollup_meta (key, value) VALUES ('layout', ?)", (layout,))
+                    # Fixed under the write lock: rebuild() folds ids up to here, add_events() everything after
+                    self.rebuilt_through = self.store.latest_id()
+                conn.commit()
+            self.schema_ready = True
+        if needs_rebuild:
+            self.rebuild()
+        return conn
+
+    def add_events(self, events):
+        """Fold a batch of newly stored events into the rollups (event store listener)"""
+        self._connect()
+        self._fold([e for e in events if e.get('id', 0) > self.rebuilt_through])
+
+    def _fold(self, events):
+        if not events:
+            return
+        counts = Counter()
+        sketch_values = defaultdict(set)
+        minute_floor = time.time() - ROLLUP_MINUTE_RETENTION_HOURS * 3600
+        for event in events:
+            for granularity, width in ROLLUP_GRANULARITIES.items():
+                if granularity == 'minute' and event['ts'] < minute_floor:
+                    continue  # Would only be purged: older windows are answered from hours
+                bucket = int(event['ts'] // width) * width
+                counts[(granularity, bucket, event['event_type'])] += 1
+                for dimension, field in self.DIMENSIONS.items():
+                    value = event.get(field)
+                    if value and value not in ROLLUP_SKIP_VALUES:
+                        sketch_values[(granularity, bucket, event['event_type'], dimension)].add(value)
+
+        positions = {}  # value -> (index, rank), hashed once per batch
+        conn = self.store._connect()
+        with self.store.write_lock:
+            conn.executemany(
+                """INSERT INTO rollup_counts (granularity, bucket, event_type, count) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (granularity, bucket, event_type) DO UPDATE SET count = count + excluded.count""",
+                [key + (count,) for key, count in counts.items()])
+            for key, values in sketch_values.items():
+                row = conn.execute(
+                    """SELECT registers FROM rollup_sketches
+                       WHERE granularity = ? AND bucket = ? AND event_type = ? AND dimension = ?""", key).fetchone()
+                sketch = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog()
+                for value in values:
+                    if value not in positions:
+                        positions[value] = HyperLogLog.position(value)
+                    sketch.add_position(*positions[value])
+                conn.execute(
+                    """INSERT OR REPLACE INTO rollup_sketches (granularity, bucket, event_type, dimension, registers)
+                       VALUES (?, ?, ?, ?, ?)""", key + (sketch.to_bytes(),))
+            conn.commit()
+
+    def rebuild(self):
+        """Fold the stored events up to rebuilt_through into empty rollups (first run after an upgrade)"""
+        conn = self.store._connect()
+        total = last_id = 0
+        while True:
+            # One short read per batch: a cursor left open across _fold() commits would pin an old
+            # WAL snapshot and make those writes fail once another thread has committed
+            rows = conn.execute("""SELECT id, ts, event_type, ip, user, country FROM events
+                                   WHERE id > ? AND id <= ? ORDER BY id LIMIT 5000""",
+                                (last_id, self.rebuilt_through)).fetchall()
+            if not rows:
+                break
+            self._fold([dict(row) for row in rows])
+            last_id = rows[-1]['id']
+            total += len(rows)
+        if total:
+            logging.info(f"Rollups rebuilt from {total} stored events")
+
+    def _buckets(self, since, until):
+        """Split [since, until) into (granularity, first_bucket, last_bucket) ranges.
+
+        Whole days use day buckets, whole hours at the edges hour buckets and
+        the partial hours minute buckets while minutes are retained (older
+        partial hours are rounded out to the whole hour).
+        """
+        minute_floor = time.time() - ROLLUP_MINUTE_RETENTION_HOURS * 3600
+        ranges = []
+
+        def split(start, end, levels):
+            if start >= end:
+                return
+            if start < minute_floor:
+                levels = [level for level in levels if level[0] != 'minute']
+            granularity, width = levels[-1]
+            if len(levels) == 1:
+                ranges.append((granularity, start // width * width, end - 1))
+                return
+            first = math.ceil(start / width) * width
+            last = end // width * width
+            if first >= last:
+                split(start, end, levels[:-1])
+                return
+            ranges.append((granularity, first, last - 1))
+            split(start, first, levels[:-1])
+            split(last, end, levels[:-1])
+
+        split(since, until, list(ROLLUP_GRANULARITIES.items()))
+        return ranges
+
+    def _where(self, since, until, event_types):
+        clauses, params = [], []
+        for granularity, first, last in self._buckets(since, until):
+            clauses.append("(granularity = ? AND bucket BETWEEN ? AND ?)")
+            params.extend([granularity, int(first), int(last)])
+        if not clauses:
+            return "0", []  # Empty window: matches nothing
+        sql = "(" + " OR ".join(clauses) + f") AND event_type IN ({', '.join('?' * len(event_types))})"
+        return sql, params + list(event_types)
+
+    def counts(self, since, until=None, event_types=()):
+        """Event counts per type over [since, until)"""
+        until = until or time.time()
+        where, params = self._where(since, until, event_types)
+        rows = self._connect().execute(
+            f"SELECT event_type, SUM(count) FROM rollup_counts WHERE {where} GROUP BY event_type", params)
+        result = {event_type: 0 for event_type in event_types}
+        result.update({row[0]: row[1] for row in rows})
+        return result
+
+    def sketch(self, since, until=None, event_types=(), dimension='ip'):
+        """Merged HyperLogLog of a dimension across event types over [since, until)"""
+        until = until or time.time()
+        where, params = self._where(since, until, event_types)
+        sketch = HyperLogLog()
+        for row in self._connect().execute(
+                f"SELECT registers FROM rollup_sketches WHERE {where} AND dimension = ?", params + [dimension]):
+            sketch.merge(HyperLogLog.from_bytes(row[0]))
+        return sketch
+
+    def distinct(self, since, until=None, event_types=(), dimension='ip'):
+        """Approximate distinct count of a dimension across event types over [since, until)"""
+        return self.sketch(since, until, event_types, dimension).count()
+
+    def purge(self):
+        """Drop minute buckets past their retention and hour/day buckets past the store's"""
+        now = time.time()
+        conn = self._connect()
+        with self.store.write_lock:
+            for table in ('rollup_counts', 'rollup_sketches'):
+                conn.execute(f"DELETE FROM {table} WHERE granularity = 'minute' AND bucket < ?",
+                             (now - ROLLUP_MINUTE_RETENTION_HOURS * 3600,))
+                conn.execute(f"DELETE FROM {table} WHERE granularity IN ('hour', 'day') AND bucket < ?",
+                             (now - self.store.retention_seconds,))
+            conn.commit()
+
+rollups = RollupStore(event_store)
+event_store.subscribe(rollups.add_events)
+
+def store_ssh_events(events):
+    """Persist parsed sshd events"""
+    event_store.add_events([{
+        'ts': e['epoch'],
+        'event_type': SSH_EVENT_TYPES[e['type']],
+        'source': 'ssh',
+        'ip': e['ip'],
+        'user': e['user'],
+        'data': e
+    } for e in events])
+
+SSH_JOURNAL_CURSOR_PATH = '/opt/ssh-monitor/ssh_journal.cursor'
+SSH_JOURNAL_IDENTIFIERS = ['sshd', 'sshd-session']  # OpenSSH >= 9.8 logs as sshd-session
+SSH_JOURNAL_BACKFILL_HOURS = 24  # Read on the very first run (no cursor, empty store)
+
+# sshd messages we understand, keyed by their first word so every line costs
+# one dict lookup plus at most one precompiled match.
+_SSHD_ADDR = r'(?P<ip>[0-9A-Fa-f:.]+) port (?P<port>\d+)'
+_SSHD_PATTERNS = {
+    'Failed': ('attack', 'failed_auth', re.compile(
+        r'Failed (?P<method>\S+) for (?:invalid user )?(?P<user>\S*) from ' + _SSHD_ADDR)),
+    'Invalid': ('attack', 'invalid_user', re.compile(
+        r'Invalid user (?P<user>\S*) from ' + _SSHD_ADDR)),
+    'Accepted': ('success', 'accepted', re.compile(
+        r'Accepted (?P<method>\S+) for (?P<user>\S+) from ' + _SSHD_ADDR)),
+    'Connection': ('disconnect', 'connection_closed', re.compile(
+        r'Connection (?:closed|reset) by (?:(?:invalid |authenticating )?user (?P<user>\S*) )?' + _SSHD_ADDR
+        + r'(?P<preauth>.*\[preauth\])?')),
+    'Disconnected': ('disconnect', 'disconnected', re.compile(
+        r'Disconnected from (?:(?:invalid |authenticating )?user (?P<user>\S*) )?' + _SSHD_ADDR
+        + r'(?P<preauth>.*\[preauth\])?')),
+    'Received': ('disconnect', 'disconnected', re.compile(
+        r'Received disconnect from ' + _SSHD_ADDR + r'(?P<preauth>.*\[preauth\])?')),
+}
+
+# (epoch second, formatted) of the last timestamp: journal entries arrive in
+# order, so consecutive lines almost always share it and skip strftime.
+_ssh_timestamp_cache = (None, None)
+
+def _format_ssh_timestamp(epoch):
+    global _ssh_timestamp_cache
+    second = int(epoch)
+    cached_second, formatted = _ssh_timestamp_cache
+    if cached_second != second:
+        formatted = datetime.fromtimestamp(second).strftime('%b %d %H:%M:%S')
+        _ssh_timestamp_cache = (second, formatted)
+    return formatted
+
+def parse_ssh_line(line, epoch):
+    """Parse one sshd journal message into an event dict (None if not relevant).
+
+    Event types: 'attack' (failed auth, invalid user), 'success' (accepted)
+    and 'disconnect' (connection closed/disconnected, flagged when preauth).
+    """
+    pattern = _SSHD_PATTERNS.get(line[:line.find(' ')])
+    if pattern is None:
+        return None
+    event_type, event, regex = pattern
+    match = regex.match(line)
+    if match is None:
+        return None
+
+    groups = match.groupdict()
+    return {
+        'type': event_type,
+        'event': event,
+        'ip': groups['ip'],
+        'port': int(groups['port']),
+        'user': groups.get('user') or 'unknown',
+        'auth_type': groups.get('method'),
+        'preauth': bool(groups.get('preauth')) or event_type == 'attack',
+        'timestamp': _format_ssh_timestamp(epoch),
+        'epoch': epoch,
+        'service': 'SSH'
+    }
+
+class SSHJournalReader:
+    """Incremental reader of sshd entries from journald.
+
+    Only entries after the last seen journal cursor are requested, already
+    filtered to sshd by journalctl, so each poll costs O(new lines). The cursor
+    is persisted across restarts, and new events are handed to the listeners
+    (the event store) rather than kept here.
+    """
+
+    def __init__(self, cursor_path=SSH_JOURNAL_CURSOR_PATH, backfill_hours=SSH_JOURNAL_BACKFILL_HOURS,
+                 since_hint=None):
+        self.cursor_path = cursor_path
+        self.backfill_seconds = backfill_hours * 3600
+        self.since_hint = since_hint  # Callable returning the newest epoch already stored
+        self.cursor = self._load_cursor()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_path, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _save_cursor(self):
+        try:
+            tmp_path = f"{self.cursor_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.cursor)
+            os.replace(tmp_path, self.cursor_path)
+        except OSError as e:
+            logging.error(f"Error saving SSH journal cursor: {e}")
+
+    def _journalctl(self, since=None, after_cursor=None):
+        cmd = ['journalctl', '--no-pager', '-o', 'json', '--output-fields=MESSAGE']
+        if after_cursor:
+            cmd.append(f'--after-cursor={after_cursor}')
+        elif since:
+            cmd.append(f"--since=@{since:.6f}")
+        cmd.extend(f'SYSLOG_IDENTIFIER={ident}' for ident in SSH_JOURNAL_IDENTIFIERS)
+        return timed_run(cmd, capture_output=True, text=True, timeout=30)
+
+    def _read(self, since=None, after_cursor=None):
+        """Run journalctl and parse its JSON lines; returns (events, last_cursor)"""
+        result = self._journalctl(since=since, after_cursor=after_cursor)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"journalctl exited with {result.returncode}")
+
+        events = []
+        last_cursor = None
+        for line in result.stdout.splitlines():
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            last_cursor = record.get('__CURSOR', last_cursor)
+            message = record.get('MESSAGE')
+            if isinstance(message, list):  # Non UTF-8 messages come as byte arrays
+                message = bytes(message).decode('utf-8', 'replace')
+            if not message:
+                continue
+            epoch = int(record.get('__REALTIME_TIMESTAMP', 0)) / 1_000_000
+            event = parse_ssh_line(message, epoch)
+            if event:
+                events.append(event)
+        return events, last_cursor
+
+    def _resume_since(self):
+        """Start time when there is no usable cursor"""
+        stored = self.since_hint() if self.since_hint else None
+        # Strictly after the newest stored event (journalctl --since is inclusive)
+        return stored + 1e-6 if stored else time.time() - self.backfill_seconds
+
+    def poll(self):
+        """Fetch entries newer than the cursor; returns the newly parsed events"""
+        with self.lock:
+            if self.cursor is None:
+                events, last_cursor = self._read(since=self._resume_since())
+            else:
+                try:
+                    events, last_cursor = self._read(after_cursor=self.cursor)
+                except RuntimeError as e:
+                    # Cursor no longer in the journal (rotated/vacuumed): resume by time instead
+                    logging.error(f"SSH journal cursor rejected, resuming by time: {e}")
+                    events, last_cursor = self._read(since=self._resume_since())
+
+            for callback in self.listeners:
+                callback(events)
+
+            if last_cursor and last_cursor != self.cursor:
+                self.cursor = last_cursor
+                self._save_cursor()
+            return events
+
+ssh_journal = SSHJournalReader(since_hint=lambda: event_store.latest_ts('ssh'))
+ssh_journal.listeners.append(store_ssh_events)
 
 def get_ssh_log_entries(hours=24):
-    """Get SSH log entries from the last N hours - FIXED VERSION"""
+    """Get SSH log entries from the last N hours"""
     try:
-        since_time = datetime.now() - timedelta(hours=hours)
-        since_str = since_time.strftime('%Y-%m-%d %H:%M:%S')
-        
-        cmd = f"journalctl --since '{since_str}' --no-pager | grep sshd"
-        output = run_command(cmd)
-        
-        entries = []
-        for line in output.split('\n'):
-            if line.strip():
-                # Parse different SSH log patterns
-                if 'Failed password' in line or 'Invalid user' in line:
-                    match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
-                    if match:
-                        ip = match.group(1)
-                        user_match = re.search(r'user (\w+)', line) or re.search(r'for (\w+)', line)
-                        user = user_match.group(1) if user_match else 'unknown'
-                        
-                        timestamp_match = re.search(r'(\w{3} \d{1,2} \d{2}:\d{2}:\d{2})', line)
-                        timestamp = timestamp_match.group(1) if timestamp_match else 'unknown'
-                        
-                        entries.append({
-                            'type': 'attack',
-                            'ip': ip,
-                            'user': user,
-                            'timestamp': timestamp,
-                            'service': 'SSH',
-                            'raw': line
-                        })
-                        
-                elif 'Accepted' in line and ('password' in line or 'publickey' in line):
-                    match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
-                    if match:
-                        ip = match.group(1)
-                        user_match = re.search(r'for (\w+)', line)
-                        user = user_match.group(1) if user_match else 'unknown'
-                        
-                        auth_type = 'publickey' if 'publickey' in line else 'password'
-                        
-                        timestamp_match = re.search(r'(\w{3} \d{1,2} \d{2}:\d{2}:\d{2})', line)
-                        timestamp = timestamp_match.group(1) if timestamp_match else 'unknown'
-                        
-                        entries.append({
-                            'type': 'success',
-                            'ip': ip,
-                            'user': user,
-                            'auth_type': auth_type,
-                            'timestamp': timestamp,
-                            'service': 'SSH',
-                            'raw': line
-                        })
-                        
+        ssh_journal.poll()
+        entries = event_store.query_events(since=time.time() - hours * 3600,
+                                           event_types=list(SSH_EVENT_TYPES.values()))
+
         logging.info(f"SSH logs processed: {len(entries)} entries found")
         return entries
     except Exception as e:
         logging.error(f"Error getting SSH log entries: {e}")
         return []
 
+DOCKER_SOCKET_PATH = '/var/run/docker.sock'
+OPENPROJECT_CONTAINER = 'openproject'
+OPENPROJECT_LOG_RETENTION_HOURS = 24
+OPENPROJECT_LOG_MAX_EVENTS = 200000  # Per event kind, bounds memory under log floods
+
+# Use simulated IP mapping for realistic geographical data
+# This is a temporary solution until real IP capture is configured
+OPENPROJECT_SIMULATED_IPS = {
+    "1": "127.0.0.1",          # System user
+    "2": "127.0.0.1",          # Anonymous user  
+    "3": "142.111.25.137",     # You (SurfShark VPN)
+    "4": "187.190.45.122",     # Carlos Diaz (Mexico/Venezuela region)
+    "5": "201.249.78.89",      # Cesar Celis (Venezuela/Colombia region)
+    "6": "190.202.156.43",     # Samantha Hernandez (Venezuela region)
+    "7": "45.137.194.210",     # Carlos Polanco (Server IP - local access)
+}
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket (Docker Engine API)"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+def docker_api_get(path, socket_path=DOCKER_SOCKET_PATH, timeout=10):
+    """GET a Docker Engine API path and return the decoded JSON body"""
+    stats = call_stats[f"docker api {path.split('?')[0].split('/')[1]}"]
+    conn = UnixHTTPConnection(socket_path, timeout=timeout)
+    started = time.perf_counter()
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = response.read()
+        stats.record(time.perf_counter() - started, exit_code=response.status, output_bytes=len(body))
+        if response.status >= 400:
+            raise RuntimeError(f"Docker API {path} returned {response.status}: {body[:200]!r}")
+        return json.loads(body) if body else None
+    except socket.timeout:
+        stats.record(time.perf_counter() - started, timed_out=True)
+        raise
+    except OSError:
+        stats.record(time.perf_counter() - started, error=True)
+        raise
+    finally:
+        conn.close()
+
+def _parse_docker_timestamp(value):
+    """Parse a Docker RFC3339Nano timestamp into (epoch, (seconds, nanoseconds))"""
+    main, _, frac = value.rstrip('Z').partition('.')
+    seconds = int(datetime.fromisoformat(main).replace(tzinfo=timezone.utc).timestamp())
+    nanos = int(frac.ljust(9, '0')[:9]) if frac else 0
+    return seconds + nanos / 1e9, (seconds, nanos)
+
+def parse_openproject_access_line(line):
+    """Parse an OpenProject request log line into an access entry (None if not one)"""
+    if 'INFO --' not in line or 'duration=' not in line or 'status=' not in line or 'method=' not in line:
+        return None
+
+    # Extract key information
+    duration_match = re.search(r'duration=([0-9.]+)', line)
+    status_match = re.search(r'status=(\d+)', line)
+    method_match = re.search(r'method=(\w+)', line)
+    path_match = re.search(r'path=([^\s]+)', line)
+    host_match = re.search(r'host=([^\s]+)', line)
+    user_match = re.search(r'user=(\d+)', line)
+    timestamp_match = re.search(r'\[([0-9-T:.]+) #', line)
+
+    if not (status_match and method_match):
+        return None
+
+    user_id = user_match.group(1) if user_match else 'anonymous'
+
+    # Override IP with simulated one if user is known
+    ip = 'unknown'
+    if user_id in OPENPROJECT_SIMULATED_IPS:
+        ip = OPENPROJECT_SIMULATED_IPS[user_id]
+    elif user_id != 'anonymous':
+        # Fallback pattern for unknown users
+        ip = f"192.168.1.{int(user_id) + 100}"
+
+    return {
+        'type': 'access',
+        'ip': ip,
+        'host': host_match.group(1) if host_match else 'unknown',
+        'user_id': user_id,
+        'method': method_match.group(1),
+        'path': path_match.group(1) if path_match else 'unknown',
+        'status': int(status_match.group(1)),
+        'duration': float(duration_match.group(1)) if duration_match else 0,
+        'timestamp': timestamp_match.group(1) if timestamp_match else 'unknown',
+        'service': 'OpenProject'
+    }
+
+def parse_openproject_failed_login_line(line):
+    """Parse: Failed login for 'username' from IP at timestamp"""
+    if 'Failed login' not in line:
+        return None
+    user_match = re.search(r"Failed login for '([^']+)'", line)
+    ip_match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
+    time_match = re.search(r'at ([0-9-]+ [0-9:]+)', line)
+    if not (user_match and ip_match):
+        return None
+    return {
+        'username': user_match.group(1),
+        'ip': ip_match.group(1),
+        'timestamp': time_match.group(1) if time_match else 'unknown',
+        'service': 'OpenProject'
+    }
+
+def parse_openproject_user_activity_line(line):
+    """Parse any log line carrying user=<id> into (user_id, rails timestamp)"""
+    if 'user=' not in line:
+        return None
+    user_match = re.search(r'user=(\d+)', line)
+    if not user_match:
+        return None
+    time_match = re.search(r'\[([0-9-T:.]+)', line)
+    return int(user_match.group(1)), time_match.group(1) if time_match else 'unknown'
+
+class DockerLogFollower:
+    """Persistent follower of a container's log stream over the Docker socket.
+
+    Replaces `docker logs --since Nh` per request: one long-lived
+    /containers/{name}/logs?follow=1 stream is parsed line by line. Access
+    and failed-login events are queued and handed to the listeners (the event
+    store) in batches by flush(); user activity stays in a bounded buffer.
+    On reconnect it resumes from the last timestamp it saw, and after a
+    restart from since_hint(). The socket path is configurable so it can run
+    against a fake Docker server.
+    """
+
+    def __init__(self, container=OPENPROJECT_CONTAINER, socket_path=DOCKER_SOCKET_PATH,
+                 retention_hours=OPENPROJECT_LOG_RETENTION_HOURS, max_events=OPENPROJECT_LOG_MAX_EVENTS,
+                 since_hint=None):
+        self.container = container
+        self.socket_path = socket_path
+        self.retention_seconds = retention_hours * 3600
+        self.since_hint = since_hint  # Callable returning the newest epoch already stored
+        # (epoch, (user_id, rails timestamp)) oldest first
+        self.user_activity = deque(maxlen=max_events)
+        self.pending = deque(maxlen=max_events)  # (kind, epoch, event) not yet flushed
+        self.listeners = []
+        self.last_seen = None  # (seconds, nanoseconds) of the newest line handled
+        self.connected = False
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start the follower thread (idempotent)"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"docker-logs-{self.container}", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        backoff = 5
+        while not self.stop_event.is_set():
+            try:
+                self._follow()  # Returns when the stream ends (container stopped/restarted)
+                backoff = 5
+            except Exception as e:
+                logging.error(f"Docker log stream for {self.container} interrupted: {e}")
+                backoff = min(backoff * 2, 60)
+            self.connected = False
+            self.stop_event.wait(backoff)
+
+    def _since_param(self):
+        if self.last_seen is None:
+            stored = self.since_hint() if self.since_hint else None
+            if not stored:
+                return str(int(time.time() - self.retention_seconds))
+            stored += 1e-6  # Lines at or before the newest stored event are skipped
+            self.last_seen = (int(stored), int((stored - int(stored)) * 1e9))
+        seconds, nanos = self.last_seen
+        return f"{seconds}.{nanos:09d}"
+
+    def _follow(self):
+        info = docker_api_get(f"/containers/{urllib.parse.quote(self.container)}/json", self.socket_path)
+        tty = bool(info.get('Config', {}).get('Tty'))
+        query = urllib.parse.urlencode({
+            'follow': 1, 'stdout': 1, 'stderr': 1, 'timestamps': 1, 'since': self._since_param()
+        })
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request('GET', f"/containers/{urllib.parse.quote(self.container)}/logs?{query}")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"logs request returned {response.status}")
+            self.connected = True
+            if tty:
+                for raw_line in iter(response.readline, b''):
+                    self._handle_line(raw_line.decode('utf-8', 'replace'))
+            else:
+                self._read_multiplexed(response)
+        finally:
+            conn.close()
+
+    def _read_multiplexed(self, response):
+        """Demultiplex the stdout/stderr frame stream of a non-TTY container"""
+        pending = {1: b'', 2: b''}
+        while True:
+            header = response.read(8)
+            if len(header) < 8:
+                return
+            stream = header[0]
+            size = int.from_bytes(header[4:8], 'big')
+            payload = response.read(size)
+            data = pending.get(stream, b'') + payload
+            *lines, rest = data.split(b'\n')
+            pending[stream] = rest
+            for raw_line in lines:
+                self._handle_line(raw_line.decode('utf-8', 'replace'))
+
+    def _handle_line(self, line):
+        line = line.rstrip('\r\n')
+        timestamp, _, message = line.partition(' ')
+        try:
+            epoch, key = _parse_docker_timestamp(timestamp)
+        except ValueError:
+            return
+        if self.last_seen is not None and key <= self.last_seen:
+            return  # Already handled before a reconnect
+        self.ingest(epoch, message)
+        self.last_seen = key
+
+    def ingest(self, epoch, message):
+        """Parse one log message and queue the events it produces"""
+        try:
+            access = parse_openproject_access_line(message)
+            failed = parse_openproject_failed_login_line(message)
+            activity = parse_openproject_user_activity_line(message)
+        except Exception as e:
+            logging.error(f"Error parsing OpenProject log line: {e}")
+            return
+        cutoff = epoch - self.retention_seconds
+        with self.lock:
+            if access is not None:
+                self.pending.append(('access', epoch, access))
+            if failed is not None:
+                self.pending.append(('failed_login', epoch, failed))
+            if activity is not None:
+                self.user_activity.append((epoch, activity))
+            while self.user_activity and self.user_activity[0][0] < cutoff:
+                self.user_activity.popleft()
+
+    def flush(self):
+        """Hand queued events to the listeners in one batch"""
+        self.start()
+        with self.lock:
+            batch = list(self.pending)
+            self.pending.clear()
+        if batch:
+            for callback in self.listeners:
+                callback(batch)
+        return batch
+
+    def get_user_activity(self, hours=1):
+        self.start()
+        cutoff = time.time() - hours * 3600
+        with self.lock:
+            return [event for epoch, event in self.user_activity if epoch >= cutoff]
+
+OPENPROJECT_EVENT_TYPES = {'access': 'op_access', 'failed_login': 'op_failed_login'}
+
+def store_openproject_events(batch):
+    """Persist parsed OpenProject access and failed-login events"""
+    event_store.add_events([{
+        'ts': epoch,
+        'event_type': OPENPROJECT_EVENT_TYPES[kind],
+        'source': 'openproject',
+        'ip': event['ip'],
+        'user': event.get('user_id') or event.get('username'),
+        'data': event
+    } for kind, epoch, event in batch])
+
+openproject_logs = DockerLogFollower(since_hint=lambda: event_store.latest_ts('openproject'))
+openproject_logs.listeners.append(store_openproject_events)
+
 def get_openproject_logs(hours=24):
     """Get OpenProject log entries from the last N hours"""
     try:
-        # Get OpenProject container logs
-        cmd = f"docker logs openproject --since {hours}h --timestamps"
-        output = run_command(cmd)
-        
-        entries = []
+        openproject_logs.flush()
+        entries = event_store.query_events(since=time.time() - hours * 3600, event_types=['op_access'])
         user_sessions = {}
         
-        for line in output.split('\n'):
-            if line.strip() and 'INFO --' in line:
-                # Parse OpenProject request logs
-                if 'duration=' in line and 'status=' in line and 'method=' in line:
-                    try:
-                        # Extract key information
-                        duration_match = re.search(r'duration=([0-9.]+)', line)
-                        status_match = re.search(r'status=(\d+)', line)
-                        method_match = re.search(r'method=(\w+)', line)
-                        path_match = re.search(r'path=([^\s]+)', line)
-                        host_match = re.search(r'host=([^\s]+)', line)
-                        user_match = re.search(r'user=(\d+)', line)
-                        timestamp_match = re.search(r'\[([0-9-T:.]+) #', line)
-                        
-                        if status_match and method_match:
-                            duration = float(duration_match.group(1)) if duration_match else 0
-                            status = int(status_match.group(1))
-                            method = method_match.group(1)
-                            path = path_match.group(1) if path_match else 'unknown'
-                            host = host_match.group(1) if host_match else 'unknown'
-                            user_id = user_match.group(1) if user_match else 'anonymous'
-                            timestamp = timestamp_match.group(1) if timestamp_match else 'unknown'
-                            
-                            # Use simulated IP mapping for realistic geographical data
-                            # This is a temporary solution until real IP capture is configured
-                            simulated_ips = {
-                                "1": "127.0.0.1",          # System user
-                                "2": "127.0.0.1",          # Anonymous user  
-                                "3": "142.111.25.137",     # You (SurfShark VPN)
-                                "4": "187.190.45.122",     # Carlos Diaz (Mexico/Venezuela region)
-                                "5": "201.249.78.89",      # Cesar Celis (Venezuela/Colombia region)
-                                "6": "190.202.156.43",     # Samantha Hernandez (Venezuela region)
-                                "7": "45.137.194.210",     # Carlos Polanco (Server IP - local access)
-                            }
-                            
-                            # Override IP with simulated one if user is known
-                            if user_id in simulated_ips:
-                                ip = simulated_ips[user_id]
-                            elif user_id != 'anonymous':
-                                # Fallback pattern for unknown users
-                                try:
-                                    uid_num = int(user_id)
-                                    ip = f"192.168.1.{uid_num + 100}"
-                                except:
-                                    ip = 'unknown'
-                            
-                            # Track user sessions
-                            if user_id != 'anonymous':
-                                user_sessions[user_id] = {
-                                    'user_id': user_id,
-                                    'host': host,
-                                    'ip': ip,
-                                    'last_activity': timestamp,
-                                    'requests': user_sessions.get(user_id, {}).get('requests', 0) + 1
-                                }
-                            
-                            entries.append({
-                                'type': 'access',
-                                'ip': ip,
-                                'host': host,
-                                'user_id': user_id,
-                                'method': method,
-                                'path': path,
-                                'status': status,
-                                'duration': duration,
-                                'timestamp': timestamp,
-                                'service': 'OpenProject',
-                                'raw': line
-                            })
-                    except Exception as e:
-                        logging.error(f"Error parsing OpenProject log line: {e}")
-                        continue
+        for entry in entries:
+            user_id = entry['user_id']
+            # Track user sessions
+            if user_id != 'anonymous':
+                user_sessions[user_id] = {
+                    'user_id': user_id,
+                    'host': entry['host'],
+                    'ip': entry['ip'],
+                    'last_activity': entry['timestamp'],
+                    'requests': user_sessions.get(user_id, {}).get('requests', 0) + 1
+                }
         
         logging.info(f"OpenProject logs processed: {len(entries)} entries, {len(user_sessions)} users found")
         return entries, list(user_sessions.values())
@@ -210,71 +1425,120 @@ def get_openproject_logs(hours=24):
         logging.error(f"Error getting OpenProject logs: {e}")
         return [], []
 
+SSH_PORTS = [22, 2234, 2222, 22222]  # Common SSH ports
+WEB_PORTS = {80: 'HTTP', 443: 'HTTPS'}
+PROC_NET_TCP_PATHS = ['/proc/net/tcp', '/proc/net/tcp6']
+TCP_STATE_ESTABLISHED = '01'
+
+def _decode_proc_address(hex_address):
+    """Decode an address from /proc/net/tcp{,6} ("0100007F:0016") into (ip, port)"""
+    hex_ip, hex_port = hex_address.split(':')
+    raw = bytes.fromhex(hex_ip)
+    # The kernel prints the address as native-endian 32-bit words
+    raw = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    if len(raw) == 4:
+        ip = str(ipaddress.IPv4Address(raw))
+    else:
+        ip6 = ipaddress.IPv6Address(raw)
+        ip = str(ip6.ipv4_mapped) if ip6.ipv4_mapped else str(ip6)
+    return ip, int(hex_port, 16)
+
+def scan_tcp_connections(local_ports):
+    """Get ESTABLISHED TCP connections on the given local ports in a single pass.
+
+    Reads /proc/net/tcp and /proc/net/tcp6 once (falling back to one
+    psutil.net_connections() call) instead of one netstat|grep per port.
+    Returns {local_port: [{'remote_ip', 'remote_port', 'local_port'}, ...]}.
+    """
+    watched = set(int(p) for p in local_ports)
+    connections = {port: [] for port in watched}
+    try:
+        for path in PROC_NET_TCP_PATHS:
+            try:
+                with open(path, 'r') as f:
+                    next(f, None)  # Header
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) < 4 or parts[3] != TCP_STATE_ESTABLISHED:
+                            continue
+                        local_port = int(parts[1].rsplit(':', 1)[1], 16)
+                        if local_port not in watched:
+                            continue
+                        remote_ip, remote_port = _decode_proc_address(parts[2])
+                        connections[local_port].append({
+                            'remote_ip': remote_ip,
+                            'remote_port': str(remote_port),
+                            'local_port': str(local_port)
+                        })
+            except FileNotFoundError:
+                if path == PROC_NET_TCP_PATHS[0]:
+                    raise
+    except OSError:
+        # No procfs (containers/other OS): a single psutil sweep instead
+        connections = {port: [] for port in watched}
+        for conn in psutil.net_connections(kind='tcp'):
+            if conn.status != psutil.CONN_ESTABLISHED or not conn.raddr or conn.laddr.port not in watched:
+                continue
+            remote_ip = conn.raddr.ip
+            if remote_ip.startswith('::ffff:'):
+                remote_ip = remote_ip[7:]
+            connections[conn.laddr.port].append({
+                'remote_ip': remote_ip,
+                'remote_port': str(conn.raddr.port),
+                'local_port': str(conn.laddr.port)
+            })
+    return connections
+
+def get_tcp_connections():
+    """Scan every watched SSH and web port in one sweep"""
+    return scan_tcp_connections(SSH_PORTS + list(WEB_PORTS))
+
+PROC_NET_INET_PATHS = PROC_NET_TCP_PATHS + ['/proc/net/udp', '/proc/net/udp6']
+
+def count_inet_sockets():
+    """Count TCP/UDP sockets (same total as psutil.net_connections('inet'), without its per-process scan)"""
+    try:
+        total = 0
+        for path in PROC_NET_INET_PATHS:
+            try:
+                with open(path, 'rb') as f:
+                    total += sum(1 for _ in f) - 1  # Minus the header
+            except FileNotFoundError:
+                if path == PROC_NET_INET_PATHS[0]:
+                    raise
+        return total
+    except OSError:
+        return len(psutil.net_connections(kind='inet'))
+
+def _is_loopback(ip):
+    try:
+        return ipaddress.ip_address(ip).is_loopback
+    except ValueError:
+        return False
+
 def get_active_web_connections():
     """Get currently active web connections (HTTP/HTTPS)"""
     connections = []
-    trusted_ips = load_trusted_ips()
     
     try:
-        # Get HTTP connections (port 80)
-        http_output = run_command("netstat -tn | grep ':80 ' | grep ESTABLISHED")
-        for line in http_output.split('\n'):
-            if line.strip():
-                parts = line.split()
-                if len(parts) >= 5:
-                    try:
-                        local_addr = parts[3]
-                        remote_addr = parts[4]
-                        
-                        remote_ip, remote_port = remote_addr.rsplit(':', 1)
-                        local_port = local_addr.split(':')[-1]
-                        
-                        if remote_ip not in ['127.0.0.1', '::1']:
-                            geo_info = get_geo_info(remote_ip)
-                            is_trusted = remote_ip in trusted_ips.get('ips', [])
-                            
-                            connections.append({
-                                'remote_ip': remote_ip,
-                                'remote_port': remote_port,
-                                'local_port': local_port,
-                                'protocol': 'HTTP',
-                                'service': 'OpenProject',
-                                'country': geo_info['country'],
-                                'is_trusted': is_trusted,
-                                'connection_time': 'Activa'
-                            })
-                    except:
-                        continue
-        
-        # Get HTTPS connections (port 443)
-        https_output = run_command("netstat -tn | grep ':443 ' | grep ESTABLISHED")
-        for line in https_output.split('\n'):
-            if line.strip():
-                parts = line.split()
-                if len(parts) >= 5:
-                    try:
-                        local_addr = parts[3]
-                        remote_addr = parts[4]
-                        
-                        remote_ip, remote_port = remote_addr.rsplit(':', 1)
-                        local_port = local_addr.split(':')[-1]
-                        
-                        if remote_ip not in ['127.0.0.1', '::1']:
-                            geo_info = get_geo_info(remote_ip)
-                            is_trusted = remote_ip in trusted_ips.get('ips', [])
-                            
-                            connections.append({
-                                'remote_ip': remote_ip,
-                                'remote_port': remote_port,
-                                'local_port': local_port,
-                                'protocol': 'HTTPS',
-                                'service': 'OpenProject',
-                                'country': geo_info['country'],
-                                'is_trusted': is_trusted,
-                                'connection_time': 'Activa'
-                            })
-                    except:
-                        continue
+        tcp_connections = collectors.get('tcp_connections')
+        for port, protocol in WEB_PORTS.items():
+            for conn in tcp_connections.get(port, []):
+                remote_ip = conn['remote_ip']
+                if not _is_loopback(remote_ip):
+                    geo_info = get_geo_info(remote_ip)
+                    is_trusted = trusted_registry.is_trusted(remote_ip)
+                    
+                    connections.append({
+                        'remote_ip': remote_ip,
+                        'remote_port': conn['remote_port'],
+                        'local_port': conn['local_port'],
+                        'protocol': protocol,
+                        'service': 'OpenProject',
+                        'country': geo_info['country'],
+                        'is_trusted': is_trusted,
+                        'connection_time': 'Activa'
+                    })
                         
     except Exception as e:
         logging.error(f"Error getting web connections: {e}")
@@ -289,48 +1553,29 @@ def get_active_ssh_sessions():
         'network_connections': []
     }
     
-    trusted_ips = load_trusted_ips()
-    
     try:
-        # Get SSH network connections using netstat for multiple SSH ports (22, 2234, 2222, etc.)
-        ssh_ports = ['22', '2234', '2222', '22222']  # Common SSH ports
-        all_connections = []
-        
-        for port in ssh_ports:
-            netstat_output = run_command(f"netstat -tn | grep ':{port} ' | grep ESTABLISHED")
-            if netstat_output:
-                all_connections.extend(netstat_output.split('\n'))
+        # Get SSH network connections from the shared single-pass TCP scan
+        tcp_connections = collectors.get('tcp_connections')
         
-        for line in all_connections:
-            if line.strip() and 'ESTABLISHED' in line:
-                parts = line.split()
-                if len(parts) >= 5:
-                    try:
-                        local_addr = parts[3]
-                        remote_addr = parts[4]
-                        
-                        remote_ip, remote_port = remote_addr.rsplit(':', 1)
-                        local_port = local_addr.split(':')[-1]
+        for port in SSH_PORTS:
+            for conn in tcp_connections.get(port, []):
+                remote_ip = conn['remote_ip']
+                if not _is_loopback(remote_ip):
+                    # Check if this IP already has a user session (avoid duplicating)
+                    existing_user_session = any(s.get('ip') == remote_ip for s in sessions_data['user_sessions'])
+                    if not existing_user_session:
+                        geo_info = get_geo_info(remote_ip)
+                        is_trusted = trusted_registry.is_trusted(remote_ip)
                         
-                        if remote_ip not in ['127.0.0.1', '::1']:
-                            # Check if this IP already has a user session (avoid duplicating)
-                            existing_user_session = any(s.get('ip') == remote_ip for s in sessions_data['user_sessions'])
-                            if not existing_user_session:
-                                geo_info = get_geo_info(remote_ip)
-                                is_trusted = remote_ip in trusted_ips.get('ips', [])
-                                
-                                sessions_data['network_connections'].append({
-                                    'remote_ip': remote_ip,
-                                    'remote_port': remote_port,
-                                    'local_port': local_port,
-                                    'service': 'SSH (Network)',
-                                    'country': geo_info['country'],
-                                    'is_trusted': is_trusted,
-                                    'connection_time': 'Activa'
-                                })
-                    except Exception as e:
-                        logging.error(f"Error parsing SSH connection: {e}")
-                        continue
+                        sessions_data['network_connections'].append({
+                            'remote_ip': remote_ip,
+                            'remote_port': conn['remote_port'],
+                            'local_port': conn['local_port'],
+                            'service': 'SSH (Network)',
+                            'country': geo_info['country'],
+                            'is_trusted': is_trusted,
+                            'connection_time': 'Activa'
+                        })
         
         # Try to get user sessions from 'w' command and 'who' command
         w_output = run_command("w")
@@ -355,7 +1600,7 @@ def get_active_ssh_sessions():
                     
                     if re.match(r'^\d+\.\d+\.\d+\.\d+$', from_ip):
                         geo_info = get_geo_info(from_ip)
-                        is_trusted = from_ip in trusted_ips.get('ips', [])
+                        is_trusted = trusted_registry.is_trusted(from_ip)
                         
                         # Determinar el tipo de conexión basado en el terminal
                         connection_type = 'SSH'
@@ -400,7 +1645,7 @@ def get_active_ssh_sessions():
                             existing = any(s.get('session_key') == session_key for s in sessions_data['user_sessions'])
                             if not existing:
                                 geo_info = get_geo_info(from_ip)
-                                is_trusted = from_ip in trusted_ips.get('ips', [])
+                                is_trusted = trusted_registry.is_trusted(from_ip)
                                 
                                 # Determinar el tipo de conexión
                                 connection_type = 'SSH'
@@ -471,6 +1716,22 @@ def get_active_ssh_sessions():
     
     return sessions_data
 
+_fail2ban_known_bans = None  # Banned IPs seen on the previous run
+
+def record_fail2ban_changes(banned):
+    """Store ban/unban events for IPs that entered or left the sshd jail"""
+    global _fail2ban_known_bans
+    current = set(banned)
+    if _fail2ban_known_bans is None:
+        _fail2ban_known_bans = event_store.active_bans()
+    now = time.time()
+    events = [{'ts': now, 'event_type': 'f2b_ban', 'source': 'fail2ban', 'ip': ip, 'data': {'ip': ip, 'jail': 'sshd', 'action': 'ban'}}
+              for ip in sorted(current - _fail2ban_known_bans)]
+    events += [{'ts': now, 'event_type': 'f2b_unban', 'source': 'fail2ban', 'ip': ip, 'data': {'ip': ip, 'jail': 'sshd', 'action': 'unban'}}
+               for ip in sorted(_fail2ban_known_bans - current)]
+    event_store.add_events(events)
+    _fail2ban_known_bans = current
+
 def get_fail2ban_status():
     """Get fail2ban status and banned IPs"""
     try:
@@ -496,6 +1757,9 @@ def get_fail2ban_status():
             'total_banned': len(banned_ips)
         }
         
+        if jail_output:
+            record_fail2ban_changes(b['ip'] for b in banned_ips)
+        
         return {
             'banned_ips': banned_ips,
             'stats': stats
@@ -505,46 +1769,193 @@ def get_fail2ban_status():
         logging.error(f"Error getting fail2ban status: {e}")
         return {'banned_ips': [], 'stats': {'jail_status': 'Error', 'total_banned': 0}}
 
+OPENPROJECT_DB_CONTAINER = 'op_db'
+# libpq DSN; when unset the op_db container address is looked up through the Docker API
+OPENPROJECT_DB_DSN = os.environ.get('OPENPROJECT_DB_DSN')
+OPENPROJECT_DB_POOL_SIZE = 4
+OPENPROJECT_USERS_TTL = 300           # Full reload of the user directory at least this often
+OPENPROJECT_USERS_CHECK_INTERVAL = 30  # Cheap updated_at watermark check
+
+# Prepared once per pooled connection: name -> (PREPARE parameter types, query)
+OPENPROJECT_DB_QUERIES = {
+    'op_active_users': ('', "SELECT id, login, firstname, lastname, mail, status, last_login_on FROM users WHERE status = 1"),
+    'op_recent_logins': ('(timestamp)', "SELECT id, login, firstname, lastname, last_login_on FROM users WHERE status = 1 AND last_login_on >= $1"),
+    'op_users_watermark': ('', "SELECT max(updated_at), count(*) FROM users"),
+}
+
+class OpenProjectDB:
+    """Small pool of direct PostgreSQL connections to the OpenProject database.
+
+    Replaces one `docker exec op_db psql` process per query. Queries are
+    server-side prepared on first use per connection. Requires psycopg2;
+    callers fall back to docker exec when it is unavailable.
+    """
+
+    def __init__(self, dsn=OPENPROJECT_DB_DSN, pool_size=OPENPROJECT_DB_POOL_SIZE):
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.pool = None
+        self.prepared = {}  # id(connection) -> set of prepared statement names
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return psycopg2 is not None
+
+    def _resolve_dsn(self):
+        if self.dsn:
+            return self.dsn
+        info = docker_api_get(f"/containers/{OPENPROJECT_DB_CONTAINER}/json")
+        networks = info.get('NetworkSettings', {}).get('Networks', {})
+        host = next((n['IPAddress'] for n in networks.values() if n.get('IPAddress')), None)
+        if not host:
+            raise RuntimeError(f"Container {OPENPROJECT_DB_CONTAINER} has no IP address")
+        password = os.environ.get('OPENPROJECT_DB_PASSWORD', '')
+        return f"host={host} port=5432 dbname=openproject user=postgres password={password} connect_timeout=5"
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = psycopg2.pool.ThreadedConnectionPool(1, self.pool_size, self._resolve_dsn())
+            return self.pool
+
+    def query(self, name, params=()):
+        """Execute a prepared query by name and return all rows"""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        started = time.perf_counter()
+        try:
+            prepared = self.prepared.setdefault(id(conn), set())
+            with conn.cursor() as cur:
+                if name not in prepared:
+                    param_types, sql = OPENPROJECT_DB_QUERIES[name]
+                    cur.execute(f"PREPARE {name}{param_types} AS {sql}")
+                    prepared.add(name)
+                if params:
+                    cur.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+                else:
+                    cur.execute(f"EXECUTE {name}")
+                rows = cur.fetchall()
+            conn.rollback()  # Read-only: end the implicit transaction
+            call_stats[f"postgres {name}"].record(time.perf_counter() - started, exit_code=0, output_bytes=len(rows))
+            return rows
+        except psycopg2.Error:
+            call_stats[f"postgres {name}"].record(time.perf_counter() - started, error=True)
+            broken = conn.closed != 0
+            if not broken:
+                conn.rollback()
+            raise
+        finally:
+            if broken:
+                self.prepared.pop(id(conn), None)
+            pool.putconn(conn, close=broken)
+
+openproject_db = OpenProjectDB()
+
+def _openproject_user_record(user_id, login, firstname, lastname):
+    """Build the login/display name pair used by every OpenProject user listing"""
+    login = login if login else f"user_{user_id}"
+    firstname = firstname if firstname else ""
+    lastname = lastname if lastname else ""
+    
+    # Create display name
+    if firstname and lastname:
+        display_name = f"{firstname} {lastname}"
+    elif login:
+        display_name = login
+    else:
+        display_name = f"User {user_id}"
+    return login, display_name
+
+def _psql_rows(sql, columns):
+    """Run a query through `docker exec op_db psql` (fallback without a driver)"""
+    output = run_command(f'docker exec {OPENPROJECT_DB_CONTAINER} psql -U postgres -d openproject -t -c "{sql}"')
+    rows = []
+    for line in output.split('\n'):
+        if line.strip() and '|' in line:
+            parts = [p.strip() for p in line.split('|')]
+            if len(parts) >= columns:
+                try:
+                    rows.append([int(parts[0])] + [p if p else None for p in parts[1:columns]])
+                except ValueError:
+                    continue
+    return rows
+
+def _load_openproject_users():
+    """Read active users from the database, through the pool when possible"""
+    if openproject_db.available:
+        try:
+            rows = openproject_db.query('op_active_users')
+        except Exception as e:
+            logging.error(f"Error querying OpenProject users through the pool: {e}")
+            rows = _psql_rows(OPENPROJECT_DB_QUERIES['op_active_users'][1], 7)
+    else:
+        rows = _psql_rows(OPENPROJECT_DB_QUERIES['op_active_users'][1], 7)
+
+    users = {}
+    for user_id, login, firstname, lastname, email, _status, last_login in rows:
+        login, display_name = _openproject_user_record(user_id, login, firstname, lastname)
+        users[user_id] = {
+            'id': user_id,
+            'login': login,
+            'display_name': display_name,
+            'email': email or "",
+            'last_login': str(last_login) if last_login else None
+        }
+    return users
+
+class OpenProjectUserDirectory:
+    """Cached id -> user map so name resolution is a dictionary lookup.
+
+    Reloaded when the users table's max(updated_at)/count watermark changes
+    (checked every OPENPROJECT_USERS_CHECK_INTERVAL) or after the TTL; when no
+    watermark can be read, only the TTL applies.
+    """
+
+    def __init__(self, ttl=OPENPROJECT_USERS_TTL, check_interval=OPENPROJECT_USERS_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.users = {}
+        self.watermark = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _current_watermark(self):
+        if not openproject_db.available:
+            return None
+        try:
+            return tuple(openproject_db.query('op_users_watermark')[0])
+        except Exception as e:
+            logging.error(f"Error checking OpenProject users watermark: {e}")
+            return None
+
+    def get_users(self):
+        now = time.time()
+        with self.lock:
+            if self.loaded_at and now - self.checked_at < self.check_interval:
+                return self.users
+            watermark = self._current_watermark()
+            self.checked_at = now
+            expired = now - self.loaded_at >= self.ttl
+            # Without a watermark (no psycopg2 / pool down) only the TTL triggers the psql fallback
+            if expired or (watermark is not None and watermark != self.watermark):
+                self.users = _load_openproject_users()
+                self.watermark = watermark
+                self.loaded_at = now
+                logging.info(f"OpenProject users loaded: {len(self.users)} users")
+            return self.users
+
+    def resolve(self, user_id):
+        return self.get_users().get(user_id, {})
+
+openproject_users = OpenProjectUserDirectory()
+
 def get_openproject_users_from_db():
     """Get real user names from OpenProject database"""
     try:
-        cmd = 'docker exec op_db psql -U postgres -d openproject -t -c "SELECT id, login, firstname, lastname, mail, status, last_login_on FROM users WHERE status = 1;"'
-        output = run_command(cmd)
-        
-        users = {}
-        for line in output.split('\n'):
-            if line.strip() and '|' in line:
-                parts = [p.strip() for p in line.split('|')]
-                if len(parts) >= 7:
-                    try:
-                        user_id = int(parts[0])
-                        login = parts[1] if parts[1] else f"user_{user_id}"
-                        firstname = parts[2] if parts[2] else ""
-                        lastname = parts[3] if parts[3] else ""
-                        email = parts[4] if parts[4] else ""
-                        last_login = parts[6] if parts[6] else None
-                        
-                        # Create display name
-                        if firstname and lastname:
-                            display_name = f"{firstname} {lastname}"
-                        elif login:
-                            display_name = login
-                        else:
-                            display_name = f"User {user_id}"
-                        
-                        users[user_id] = {
-                            'id': user_id,
-                            'login': login,
-                            'display_name': display_name,
-                            'email': email,
-                            'last_login': last_login
-                        }
-                    except (ValueError, IndexError):
-                        continue
-        
-        logging.info(f"OpenProject users loaded: {len(users)} users")
-        return users
-        
+        return dict(openproject_users.get_users())
     except Exception as e:
         logging.error(f"Error getting OpenProject users from DB: {e}")
         return {}
@@ -552,38 +1963,12 @@ def get_openproject_users_from_db():
 def get_openproject_failed_logins(hours=24):
     """Get OpenProject failed login attempts from logs"""
     try:
-        since_time = datetime.now() - timedelta(hours=hours)
-        since_hours = f"{hours}h"
-        
-        cmd = f"docker logs openproject --since={since_hours} | grep 'Failed login'"
-        output = run_command(cmd)
-        
         failed_logins = []
-        for line in output.split('\n'):
-            if line.strip() and 'Failed login' in line:
-                # Parse: Failed login for 'username' from IP at timestamp
-                try:
-                    user_match = re.search(r"Failed login for '([^']+)'", line)
-                    ip_match = re.search(r'from (\d+\.\d+\.\d+\.\d+)', line)
-                    time_match = re.search(r'at ([0-9-]+ [0-9:]+)', line)
-                    
-                    if user_match and ip_match:
-                        username = user_match.group(1)
-                        ip = ip_match.group(1)
-                        timestamp = time_match.group(1) if time_match else 'unknown'
-                        
-                        geo_info = get_geo_info(ip)
-                        
-                        failed_logins.append({
-                            'username': username,
-                            'ip': ip,
-                            'timestamp': timestamp,
-                            'country': geo_info['country'],
-                            'service': 'OpenProject'
-                        })
-                except Exception as e:
-                    logging.error(f"Error parsing failed login line: {e}")
-                    continue
+        openproject_logs.flush()
+        since = time.time() - hours * 3600
+        for attempt in event_store.query_events(since=since, event_types=['op_failed_login']):
+            geo_info = get_geo_info(attempt['ip'])
+            failed_logins.append({**attempt, 'country': geo_info['country']})
         
         logging.info(f"OpenProject failed logins: {len(failed_logins)} attempts")
         return failed_logins
@@ -596,40 +1981,30 @@ def get_openproject_successful_logins(hours=24):
     """Get OpenProject successful logins from database"""
     try:
         since_time = datetime.now() - timedelta(hours=hours)
-        since_str = since_time.strftime('%Y-%m-%d %H:%M:%S')
         
-        cmd = f'docker exec op_db psql -U postgres -d openproject -t -c "SELECT id, login, firstname, lastname, last_login_on FROM users WHERE status = 1 AND last_login_on >= \'{since_str}\';"'
-        output = run_command(cmd)
+        if openproject_db.available:
+            try:
+                rows = openproject_db.query('op_recent_logins', (since_time,))
+            except Exception as e:
+                logging.error(f"Error querying OpenProject logins through the pool: {e}")
+                rows = None
+        else:
+            rows = None
+        if rows is None:
+            since_str = since_time.strftime('%Y-%m-%d %H:%M:%S')
+            sql = OPENPROJECT_DB_QUERIES['op_recent_logins'][1].replace('$1', f"'{since_str}'")
+            rows = _psql_rows(sql, 5)
         
         successful_logins = []
-        for line in output.split('\n'):
-            if line.strip() and '|' in line:
-                parts = [p.strip() for p in line.split('|')]
-                if len(parts) >= 5:
-                    try:
-                        user_id = int(parts[0])
-                        login = parts[1] if parts[1] else f"user_{user_id}"
-                        firstname = parts[2] if parts[2] else ""
-                        lastname = parts[3] if parts[3] else ""
-                        last_login = parts[4] if parts[4] else ""
-                        
-                        # Create display name
-                        if firstname and lastname:
-                            display_name = f"{firstname} {lastname}"
-                        elif login:
-                            display_name = login
-                        else:
-                            display_name = f"User {user_id}"
-                        
-                        successful_logins.append({
-                            'user_id': user_id,
-                            'username': display_name,
-                            'login': login,
-                            'last_login': last_login,
-                            'service': 'OpenProject'
-                        })
-                    except (ValueError, IndexError):
-                        continue
+        for user_id, login, firstname, lastname, last_login in rows:
+            login, display_name = _openproject_user_record(user_id, login, firstname, lastname)
+            successful_logins.append({
+                'user_id': user_id,
+                'username': display_name,
+                'login': login,
+                'last_login': str(last_login) if last_login else "",
+                'service': 'OpenProject'
+            })
         
         logging.info(f"OpenProject successful logins: {len(successful_logins)} users")
         return successful_logins
@@ -641,65 +2016,36 @@ def get_openproject_successful_logins(hours=24):
 def get_openproject_active_users(hours=1):
     """Get currently active OpenProject users from recent logs"""
     try:
-        since_hours = f"{hours}h"
-        cmd = f"docker logs openproject --since={since_hours} | grep 'user=' | tail -100"
-        output = run_command(cmd)
+        # Most recent user activity (as the previous `grep 'user=' | tail -100`)
+        activity = openproject_logs.get_user_activity(hours)[-100:]
         
-        # Get user database for name resolution
-        users_db = get_openproject_users_from_db()
+        # Cached user directory: name resolution is a dictionary lookup
+        users_db = openproject_users.get_users()
         
         active_users = {}
         user_ips = {}
         
-        # IP simulation mapping for users (temporary solution)
-        # This simulates realistic IPs for different users until real IP capture is configured
-        simulated_ips = {
-            1: "127.0.0.1",          # System user
-            2: "127.0.0.1",          # Anonymous user  
-            3: "142.111.25.137",     # You (SurfShark VPN)
-            4: "187.190.45.122",     # Carlos Diaz (Mexico/Venezuela region)
-            5: "201.249.78.89",      # Cesar Celis (Venezuela/Colombia region)
-            6: "190.202.156.43",     # Samantha Hernandez (Venezuela region)
-            7: "45.137.194.210",     # Carlos Polanco (Server IP - local access)
-        }
-        
-        for line in output.split('\n'):
-            if line.strip() and 'user=' in line:
-                try:
-                    # Extract user ID
-                    user_match = re.search(r'user=(\d+)', line)
-                    # Extract timestamp
-                    time_match = re.search(r'\[([0-9-T:.]+)', line)
-                    
-                    if user_match:
-                        user_id = int(user_match.group(1))
-                        
-                        # Skip system users (1=System, 2=Anonymous)
-                        if user_id <= 2:
-                            continue
-                        
-                        # Use simulated IP based on user ID
-                        ip = simulated_ips.get(user_id, f"192.168.1.{user_id + 100}")  # Fallback pattern
-                        
-                        timestamp = time_match.group(1) if time_match else 'unknown'
-                        
-                        # Get user info from database
-                        user_info = users_db.get(user_id, {})
-                        display_name = user_info.get('display_name', f'User {user_id}')
-                        
-                        active_users[user_id] = {
-                            'user_id': user_id,
-                            'username': display_name,
-                            'login': user_info.get('login', ''),
-                            'last_activity': timestamp,
-                            'service': 'OpenProject'
-                        }
-                        
-                        user_ips[user_id] = ip
-                            
-                except Exception as e:
-                    logging.error(f"Error parsing active user line: {e}")
-                    continue
+        for user_id, timestamp in activity:
+            # Skip system users (1=System, 2=Anonymous)
+            if user_id <= 2:
+                continue
+            
+            # Use simulated IP based on user ID (temporary until real IP capture is configured)
+            ip = OPENPROJECT_SIMULATED_IPS.get(str(user_id), f"192.168.1.{user_id + 100}")  # Fallback pattern
+            
+            # Get user info from database
+            user_info = users_db.get(user_id, {})
+            display_name = user_info.get('display_name', f'User {user_id}')
+            
+            active_users[user_id] = {
+                'user_id': user_id,
+                'username': display_name,
+                'login': user_info.get('login', ''),
+                'last_activity': timestamp,
+                'service': 'OpenProject'
+            }
+            
+            user_ips[user_id] = ip
         
         # Add IP and geo info to active users
         for user_id, user_data in active_users.items():
@@ -709,8 +2055,7 @@ def get_openproject_active_users(hours=1):
                 geo_info = get_geo_info(ip)
                 user_data['country'] = geo_info['country']
                 
-                trusted_ips = load_trusted_ips()
-                user_data['is_trusted'] = ip in trusted_ips.get('ips', [])
+                user_data['is_trusted'] = trusted_registry.is_trusted(ip)
             else:
                 user_data['ip'] = 'unknown'
                 user_data['country'] = 'Unknown'
@@ -724,15 +2069,236 @@ def get_openproject_active_users(hours=1):
         logging.error(f"Error getting OpenProject active users: {e}")
         return []
 
+BRUTE_FORCE_EVENT_TYPES = {'ssh_attack': 'SSH', 'op_failed_login': 'OpenProject'}  # Failed authentications
+BURST_WINDOW, BURST_BUCKETS, BURST_THRESHOLD = 60, 12, 20  # Failures per minute from one IP
+SLOW_WINDOW, SLOW_BUCKETS, SLOW_THRESHOLD = 86400, 24, 30  # Failures per day from one IP...
+SLOW_MIN_ACTIVE_HOURS = 6                                  # ...spread over at least this many hours
+SPRAY_WINDOW, SPRAY_USERNAMES = 600, 10                    # Distinct usernames from one IP in 10 minutes
+DISTRIBUTED_WINDOW, DISTRIBUTED_IPS = 3600, 10             # Distinct IPs against one username in an hour
+DETECTOR_MAX_KEYS = 20000   # Tracked IPs and usernames each; least recently seen are evicted first
+ALERT_COOLDOWN = 900        # Seconds before the same (kind, key) alert is stored again
+SLOW_ALERT_COOLDOWN = 21600  # Low-and-slow alerts refresh on every failure past the threshold: store them rarely
+ALERT_MAX = 500
+ALERT_KINDS = {
+    'burst': ('Ráfaga de fuerza bruta', 'high'),
+    'low_and_slow': ('Fuerza bruta lenta (low-and-slow)', 'medium'),
+    'spray': ('Spray de usuarios', 'high'),
+    'distributed': ('Ataque distribuido a un usuario', 'high'),
+}
+
+class RingCounter:
+    """Count of events over a sliding window split into fixed-width ring buckets.
+
+    add() is O(1) amortised: moving the head clears at most one bucket per
+    elapsed bucket width. Events older than the window are ignored.
+    """
+
+    __slots__ = ('width', 'counts', 'head', 'total', 'active')
+
+    def __init__(self, window, buckets):
+        self.width = window / buckets
+        self.counts = [0] * buckets
+        self.head = None  # Absolute index of the newest bucket
+        self.total = 0
+        self.active = 0   # Non-empty buckets
+
+    def _advance(self, index):
+        if self.head is not None:
+            for step in range(1, min(index - self.head, len(self.counts)) + 1):
+                slot = (self.head + step) % len(self.counts)
+                if self.counts[slot]:
+                    self.total -= self.counts[slot]
+                    self.active -= 1
+                    self.counts[slot] = 0
+        self.head = index
+
+    def add(self, ts):
+        index = int(ts // self.width)
+        if self.head is None or index > self.head:
+            self._advance(index)
+        elif index <= self.head - len(self.counts):
+            return
+        slot = index % len(self.counts)
+        if not self.counts[slot]:
+            self.active += 1
+        self.counts[slot] += 1
+        self.total += 1
+
+class RecentSet:
+    """Distinct values seen within a sliding window, capped at `limit` entries"""
+
+    __slots__ = ('window', 'limit', 'seen')
+
+    def __init__(self, window, limit):
+        self.window = window
+        self.limit = limit
+        self.seen = OrderedDict()  # value -> last ts, oldest first
+
+    def add(self, value, ts):
+        if ts >= self.seen.get(value, ts):
+            self.seen.pop(value, None)
+            self.seen[value] = ts
+        while self.seen and (len(self.seen) > self.limit or next(iter(self.seen.values())) < ts - self.window):
+            self.seen.popitem(last=False)
+        return len(self.seen)
+
+class BruteForceDetector:
+    """Streaming SSH/OpenProject brute-force detection over stored failed logins.
+
+    Subscribed to the event store, it updates per-IP and per-username
+    sliding windows as each failed authentication arrives and raises:
+    bursts (many failures per minute from one IP), low-and-slow attacks
+    (many failures spread over the day, never fast enough to burst), sprays
+    (many usernames from one IP) and distributed attacks (many IPs against
+    one username). State is bounded: idle or least recently seen keys are
+    evicted. Trusted IPs are ignored. On first use the windows are warmed up
+    from the store so a restart does not reset them; alerts found during the
+    warm-up are kept in memory only (neither stored nor logged again), new
+    ones are also stored as 'intrusion_alert' events.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.ips = OrderedDict()    # ip -> per-IP state, least recently seen first
+        self.users = OrderedDict()  # username -> RecentSet of IPs
+        self.active = OrderedDict()  # (kind, key) -> alert dict
+        self.lock = threading.RLock()
+        self.warmed_through = None  # Highest event id folded in by the warm-up
+        self.warming = False        # Replaying stored events: alerts were already logged before the restart
+        self.now = 0
+        store.subscribe(self.add_events)
+
+    def _warm_up(self, through=None):
+        """Replay the last day of stored failed logins (events up to id `through`, default all)"""
+        if self.warmed_through is not None:
+            return
+        self.warmed_through = self.store.latest_id() if through is None else through
+        since = time.time() - SLOW_WINDOW
+        self.warming = True
+        try:
+            for row in self.store.iter_rows(since=since, event_types=list(BRUTE_FORCE_EVENT_TYPES)):
+                if row['id'] <= self.warmed_through:
+                    # Alerts raised here were stored before the restart: only the in-memory state is rebuilt
+                    self._observe(row['ts'], row['event_type'], row['ip'], row['user'])
+        finally:
+            self.warming = False
+
+    def add_events(self, events):
+        """Event store listener"""
+        raised = []
+        with self.lock:
+            self._warm_up(through=min(event.get('id', 0) for event in events) - 1)
+            for event in events:
+                if event['event_type'] in BRUTE_FORCE_EVENT_TYPES and event.get('id', 0) > self.warmed_through:
+                    raised.extend(self._observe(event['ts'], event['event_type'], event.get('ip'), event.get('user')))
+        if raised:
+            self.store.add_events([{
+                'ts': alert['last_seen'], 'event_type': 'intrusion_alert', 'source': 'detector', 'ip': alert['ip'],
+                'user': alert['user'], 'data': alert
+            } for alert in raised])
+
+    def _ip_state(self, ip):
+        state = self.ips.pop(ip, None)
+        if state is None:
+            state = {
+                'burst': RingCounter(BURST_WINDOW, BURST_BUCKETS),
+                'slow': RingCounter(SLOW_WINDOW, SLOW_BUCKETS),
+                'users': RecentSet(SPRAY_WINDOW, SPRAY_USERNAMES * 2),
+                'last': 0
+            }
+        self.ips[ip] = state
+        return state
+
+    def _evict(self, table, last_seen):
+        cutoff = self.now - SLOW_WINDOW
+        while table and (len(table) > DETECTOR_MAX_KEYS or last_seen(next(iter(table.values()))) < cutoff):
+            table.popitem(last=False)
+
+    def _observe(self, ts, event_type, ip, user):
+        """Fold one failed login into the windows; returns alerts that should be stored"""
+        if not ip or ip == 'unknown' or trusted_registry.is_trusted(ip):
+            return []
+        self.now = max(self.now, ts)
+        user = user if user and user != 'unknown' else None
+        service = BRUTE_FORCE_EVENT_TYPES[event_type]
+        raised = []
+
+        state = self._ip_state(ip)
+        state['last'] = max(state['last'], ts)
+        state['burst'].add(ts)
+        state['slow'].add(ts)
+        if state['burst'].total >= BURST_THRESHOLD:
+            raised.append(self._raise('burst', ip, ts, state['burst'].total, BURST_WINDOW, service, ip=ip))
+        elif (state['slow'].total >= SLOW_THRESHOLD and state['slow'].active >= SLOW_MIN_ACTIVE_HOURS
+              and ('burst', ip) not in self.active):
+            raised.append(self._raise('low_and_slow', ip, ts, state['slow'].total, SLOW_WINDOW, service, ip=ip))
+        if user:
+            usernames = state['users'].add(user, ts)
+            if usernames >= SPRAY_USERNAMES:
+                raised.append(self._raise('spray', ip, ts, usernames, SPRAY_WINDOW, service, ip=ip))
+            sources = self.users.pop(user, None) or RecentSet(DISTRIBUTED_WINDOW, DISTRIBUTED_IPS * 2)
+            self.users[user] = sources
+            ip_count = sources.add(ip, ts)
+            if ip_count >= DISTRIBUTED_IPS:
+                raised.append(self._raise('distributed', user, ts, ip_count, DISTRIBUTED_WINDOW, service, user=user))
+        self._evict(self.ips, lambda s: s['last'])
+        self._evict(self.users, lambda s: next(reversed(s.seen.values()), 0))
+        return [alert for alert in raised if alert is not None]
+
+    def _raise(self, kind, key, ts, count, window, service, ip=None, user=None):
+        """Create or refresh the alert for (kind, key); returns it when it is due to be stored"""
+        title, severity = ALERT_KINDS[kind]
+        alert = self.active.pop((kind, key), None)
+        if alert is None:
+            geo = get_geo_info(ip) if ip else UNKNOWN_IP_INFO
+            alert = {'kind': kind, 'type': title, 'severity': severity, 'ip': ip, 'user': user,
+                     'country': geo['country'], 'city': geo['city'], 'first_seen': ts, 'stored_at': None}
+        last_seen = max(ts, alert.get('last_seen', ts))
+        alert.update(attempts=count, window=window, service=service, last_seen=last_seen,
+                     timestamp=datetime.fromtimestamp(last_seen, timezone.utc).isoformat(),
+                     message=self._message(kind, ip, user, count, window))
+        self.active[(kind, key)] = alert
+        while len(self.active) > ALERT_MAX:
+            self.active.popitem(last=False)
+        cooldown = SLOW_ALERT_COOLDOWN if kind == 'low_and_slow' else ALERT_COOLDOWN
+        if alert['stored_at'] is None or ts - alert['stored_at'] >= cooldown:
+            alert['stored_at'] = ts
+            if kind in ('burst', 'spray', 'distributed') and not self.warming:
+                logging.warning(f"Intrusion alert: {alert['message']}")
+            return {k: v for k, v in alert.items() if k != 'stored_at'}
+        return None
+
+    @staticmethod
+    def _message(kind, ip, user, count, window):
+        minutes = window // 60
+        if kind == 'burst':
+            return f"{count} intentos fallidos desde {ip} en {minutes} min"
+        if kind == 'low_and_slow':
+            return f"{count} intentos fallidos desde {ip} repartidos en {window // 3600} h"
+        if kind == 'spray':
+            return f"{count} usuarios distintos probados desde {ip} en {minutes} min"
+        return f"{count} IPs distintas atacando al usuario '{user}' en {minutes} min"
+
+    def alerts(self, max_age=SLOW_WINDOW):
+        """Alerts seen within `max_age` seconds, most recent first"""
+        with self.lock:
+            self._warm_up()
+            cutoff = time.time() - max_age
+            current = [alert for alert in self.active.values() if alert['last_seen'] >= cutoff]
+        return [{k: v for k, v in alert.items() if k != 'stored_at'}
+                for alert in sorted(current, key=lambda a: a['last_seen'], reverse=True)]
+
+brute_force = BruteForceDetector(event_store)
+
 def detect_potential_intruders():
     """Detect potential security issues in OpenProject"""
     try:
         # Get total registered users
-        users_db = get_openproject_users_from_db()
+        users_db = collectors.get('op_users_db') or {}
         total_registered = len(users_db)
         
         # Get currently active users
-        active_users = get_openproject_active_users(1)
+        active_users = collectors.get('op_active_users') or []
         total_active = len(active_users)
         
         # Check for anomalies
@@ -762,157 +2328,274 @@ def detect_potential_intruders():
         logging.error(f"Error detecting potential intruders: {e}")
         return {'total_registered': 0, 'total_active': 0, 'alerts': []}
 
-def create_combined_map(ssh_attacks, ssh_successful, openproject_access, active_ssh, active_web):
-    """Create a comprehensive map showing SSH and OpenProject activity"""
-    try:
-        m = folium.Map(location=[20, 0], zoom_start=2)
-        trusted_ips = load_trusted_ips()
-        
-        # Add SSH attack markers (red circles)
-        attack_counts = Counter()
-        for attack in ssh_attacks[-100:]:
-            geo_info = get_geo_info(attack['ip'])
-            if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                attack_counts[(geo_info['lat'], geo_info['lon'], attack['ip'])] += 1
-        
-        # Log real attacks found for debugging
-        logging.info(f"Processing {len(ssh_attacks)} SSH attacks for map visualization")
-        
-        for (lat, lon, ip), count in attack_counts.items():
-            folium.CircleMarker(
-                location=[lat, lon],
-                radius=min(count * 2, 20),
-                popup=f"🔴 SSH Ataques desde {ip}<br>Total: {count}",
-                color='#dc2626',
-                weight=2,
-                fill=True,
-                fillColor='#ef4444',
-                fillOpacity=0.4  # Más translúcido
-            ).add_to(m)
-        
-        # Add SSH successful connections (green circles)
-        ssh_success_counts = Counter()
-        for conn in ssh_successful[-50:]:
-            geo_info = get_geo_info(conn['ip'])
-            if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                ssh_success_counts[(geo_info['lat'], geo_info['lon'], conn['ip'])] += 1
+MapMarker = namedtuple('MapMarker', ['lat', 'lon', 'radius', 'popup', 'color', 'weight', 'fill_color', 'fill_opacity'])
+
+def build_map_markers(ssh_attacks, ssh_successful, openproject_access, active_ssh, active_web):
+    """Compute the combined map's markers (cheap; rendering them is the expensive part)"""
+    markers = []
+    ip_info = enrich_ips(
+        [e['ip'] for e in ssh_attacks[-100:]] + [e['ip'] for e in ssh_successful[-50:]] +
+        [e['ip'] for e in openproject_access[-50:]] +
+        [s['remote_ip'] for s in active_ssh.get('network_connections', [])] + [c['remote_ip'] for c in active_web]
+    )
+    
+    def located(ip):
+        geo_info = ip_info.get(ip, UNKNOWN_IP_INFO)
+        return geo_info if geo_info['lat'] != 0 and geo_info['lon'] != 0 else None
+    
+    # SSH attack markers (red circles)
+    attack_counts = Counter()
+    for attack in ssh_attacks[-100:]:
+        geo_info = located(attack['ip'])
+        if geo_info:
+            attack_counts[(geo_info['lat'], geo_info['lon'], attack['ip'])] += 1
+    
+    for (lat, lon, ip), count in attack_counts.items():
+        markers.append(MapMarker(lat, lon, min(count * 2, 20), f"🔴 SSH Ataques desde {ip}<br>Total: {count}",
+                                 '#dc2626', 2, '#ef4444', 0.4))  # Más translúcido
+    
+    # SSH successful connections (green circles)
+    ssh_success_counts = Counter()
+    for conn in ssh_successful[-50:]:
+        geo_info = located(conn['ip'])
+        if geo_info:
+            ssh_success_counts[(geo_info['lat'], geo_info['lon'], conn['ip'])] += 1
+    
+    for (lat, lon, ip), count in ssh_success_counts.items():
+        is_trusted = ip_info[ip]['is_trusted']
+        is_admin = ip == '142.111.25.137'  # ⭐ Tu IP especial
         
-        for (lat, lon, ip), count in ssh_success_counts.items():
-            is_trusted = ip in trusted_ips.get('ips', [])
-            is_admin = ip == '142.111.25.137'  # ⭐ Tu IP especial
-            
-            if is_admin:
-                color = '#6366f1'  # Indigo especial para admin
-                fillColor = '#8b5cf6'  # Violeta brillante
-                icon = '👑🔥'  # Icono especial de admin
-                radius = 10  # Más grande
-                popup_text = f"{icon} ADMIN SSH desde {ip}<br>🎯 Acceso Privilegiado"
-            elif is_trusted:
-                color = '#1d4ed8'
-                fillColor = '#3b82f6'
-                icon = '🔵'
-                radius = 8
-                popup_text = f"{icon} SSH Exitosa desde {ip}<br>(IP Confiable)"
+        if is_admin:
+            # Indigo/violeta especial para admin, más grande y visible
+            markers.append(MapMarker(lat, lon, 10, f"👑🔥 ADMIN SSH desde {ip}<br>🎯 Acceso Privilegiado",
+                                     '#6366f1', 3, '#8b5cf6', 0.7))
+        elif is_trusted:
+            markers.append(MapMarker(lat, lon, 8, f"🔵 SSH Exitosa desde {ip}<br>(IP Confiable)",
+                                     '#1d4ed8', 2, '#3b82f6', 0.5))
+        else:
+            markers.append(MapMarker(lat, lon, 8, f"🟢 SSH Exitosa desde {ip}", '#059669', 2, '#10b981', 0.5))
+    
+    # OpenProject access markers (orange circles)
+    op_access_counts = Counter()
+    for access in openproject_access[-50:]:
+        geo_info = located(access['ip'])
+        if geo_info:
+            op_access_counts[(geo_info['lat'], geo_info['lon'], access['ip'])] += 1
+    
+    for (lat, lon, ip), count in op_access_counts.items():
+        is_trusted = ip_info[ip]['is_trusted']
+        icon = '🟣' if is_trusted else '🟠'
+        markers.append(MapMarker(
+            lat, lon, 6, f"{icon} OpenProject desde {ip}<br>Accesos: {count}<br>{'(IP Confiable)' if is_trusted else ''}",
+            '#7c3aed' if is_trusted else '#ea580c', 2, '#8b5cf6' if is_trusted else '#f97316', 0.5))
+    
+    # Active SSH sessions (large circles)
+    for session in active_ssh.get('network_connections', []):
+        geo_info = located(session['remote_ip'])
+        if geo_info:
+            if session['remote_ip'] == '142.111.25.137':
+                popup_text = f"👑🔥 ADMIN SSH ACTIVA desde {session['remote_ip']}<br>🎯 Sesión Privilegiada<br>Puerto: {session['remote_port']}"
+                markers.append(MapMarker(geo_info['lat'], geo_info['lon'], 15, popup_text, '#6366f1', 4, '#8b5cf6', 0.8))
             else:
-                color = '#059669'
-                fillColor = '#10b981'
-                icon = '🟢'
-                radius = 8
-                popup_text = f"{icon} SSH Exitosa desde {ip}"
-            
-            folium.CircleMarker(
-                location=[lat, lon],
-                radius=radius,
-                popup=popup_text,
-                color=color,
-                weight=3 if is_admin else 2,
-                fill=True,
-                fillColor=fillColor,
-                fillOpacity=0.7 if is_admin else 0.5  # Admin más visible
-            ).add_to(m)
-        
-        # Add OpenProject access markers (orange triangles)
-        op_access_counts = Counter()
-        for access in openproject_access[-50:]:
-            if access['ip'] != 'unknown':
-                geo_info = get_geo_info(access['ip'])
-                if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                    op_access_counts[(geo_info['lat'], geo_info['lon'], access['ip'])] += 1
-        
-        for (lat, lon, ip), count in op_access_counts.items():
-            is_trusted = ip in trusted_ips.get('ips', [])
-            color = 'purple' if is_trusted else 'orange'
-            icon = '🟣' if is_trusted else '🟠'
-            
+                popup_text = f"🔵 SSH Activa desde {session['remote_ip']}<br>{'(IP Confiable)' if session['is_trusted'] else ''}<br>Puerto: {session['remote_port']}"
+                markers.append(MapMarker(geo_info['lat'], geo_info['lon'], 12, popup_text, '#1e40af', 3, '#3b82f6', 0.6))
+    
+    # Active web connections (large purple circles)
+    for conn in active_web:
+        geo_info = located(conn['remote_ip'])
+        if geo_info:
+            markers.append(MapMarker(
+                geo_info['lat'], geo_info['lon'], 10,
+                f"🟣 {conn['protocol']} Activa desde {conn['remote_ip']}<br>{'(IP Confiable)' if conn['is_trusted'] else ''}<br>Puerto: {conn['remote_port']}",
+                '#7c2d12', 2, '#a855f7', 0.5))
+    
+    return markers
+
+def render_map(markers):
+    """Render markers into the folium map HTML (CPU-heavy)"""
+    try:
+        m = folium.Map(location=[20, 0], zoom_start=2)
+        for marker in markers:
             folium.CircleMarker(
-                location=[lat, lon],
-                radius=6,
-                popup=f"{icon} OpenProject desde {ip}<br>Accesos: {count}<br>{'(IP Confiable)' if is_trusted else ''}",
-                color='#7c3aed' if is_trusted else '#ea580c',
-                weight=2,
+                location=[marker.lat, marker.lon],
+                radius=marker.radius,
+                popup=marker.popup,
+                color=marker.color,
+                weight=marker.weight,
                 fill=True,
-                fillColor='#8b5cf6' if is_trusted else '#f97316',
-                fillOpacity=0.5  # Más translúcido
+                fillColor=marker.fill_color,
+                fillOpacity=marker.fill_opacity
             ).add_to(m)
-        
-        # Add active SSH sessions (large circles)
-        for session in active_ssh.get('network_connections', []):
-            geo_info = get_geo_info(session['remote_ip'])
-            if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                is_admin = session['remote_ip'] == '142.111.25.137'
-                
-                if is_admin:
-                    popup_text = f"👑🔥 ADMIN SSH ACTIVA desde {session['remote_ip']}<br>🎯 Sesión Privilegiada<br>Puerto: {session['remote_port']}"
-                    color = '#6366f1'
-                    fillColor = '#8b5cf6'
-                    radius = 15  # Más grande para admin
-                    weight = 4
-                    opacity = 0.8
-                else:
-                    popup_text = f"🔵 SSH Activa desde {session['remote_ip']}<br>{'(IP Confiable)' if session['is_trusted'] else ''}<br>Puerto: {session['remote_port']}"
-                    color = '#1e40af'
-                    fillColor = '#3b82f6'
-                    radius = 12
-                    weight = 3
-                    opacity = 0.6
-                
-                folium.CircleMarker(
-                    location=[geo_info['lat'], geo_info['lon']],
-                    radius=radius,
-                    popup=popup_text,
-                    color=color,
-                    weight=weight,
-                    fill=True,
-                    fillColor=fillColor,
-                    fillOpacity=opacity
-                ).add_to(m)
-        
-        # Add active web connections (large purple circles)
-        for conn in active_web:
-            geo_info = get_geo_info(conn['remote_ip'])
-            if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                folium.CircleMarker(
-                    location=[geo_info['lat'], geo_info['lon']],
-                    radius=10,
-                    popup=f"🟣 {conn['protocol']} Activa desde {conn['remote_ip']}<br>{'(IP Confiable)' if conn['is_trusted'] else ''}<br>Puerto: {conn['remote_port']}",
-                    color='#7c2d12',
-                    weight=2,
-                    fill=True,
-                    fillColor='#a855f7',
-                    fillOpacity=0.5  # Más translúcido
-                ).add_to(m)
-        
         return m._repr_html_()
-        
     except Exception as e:
         logging.error(f"Error creating combined map: {e}")
         return "<p>Error generando mapa</p>"
 
+def create_combined_map(ssh_attacks, ssh_successful, openproject_access, active_ssh, active_web):
+    """Create a comprehensive map showing SSH and OpenProject activity"""
+    logging.info(f"Processing {len(ssh_attacks)} SSH attacks for map visualization")
+    return render_map(build_map_markers(ssh_attacks, ssh_successful, openproject_access, active_ssh, active_web))
+
+MAP_RENDER_CACHE_SIZE = 16  # Finished renders kept across layer sets and data versions
+MAP_LAYERS = ('ssh_attacks', 'ssh_successful', 'openproject', 'https')  # Valid `hide` values of /api/map
+
+class MapRenderCache:
+    """Finished map renders keyed by (hidden layers, marker-set version).
+
+    A request whose marker set has no render yet is answered with the latest
+    finished render for its layer set while a worker thread re-renders in the
+    background; only the very first render of a layer set happens on the
+    request thread.
+    """
+
+    def __init__(self, renderer=render_map, size=MAP_RENDER_CACHE_SIZE):
+        self.renderer = renderer
+        self.size = size
+        self.renders = OrderedDict()  # (hide, version) -> html
+        self.latest = OrderedDict()   # hide -> (version, html), least recently stored first
+        self.pending = {}             # hide -> (version, markers) awaiting a render
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = None
+
+    @staticmethod
+    def version(markers):
+        return hashlib.blake2b(repr(markers).encode(), digest_size=12).hexdigest()
+
+    def _store(self, hide, version, html):
+        with self.lock:
+            self.renders[(hide, version)] = html
+            self.renders.move_to_end((hide, version))
+            while len(self.renders) > self.size:
+                self.renders.popitem(last=False)
+            self.latest[hide] = (version, html)
+            self.latest.move_to_end(hide)
+            while len(self.latest) > self.size:
+                self.latest.popitem(last=False)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                self.wakeup.clear()
+                jobs, self.pending = self.pending, {}
+            for hide, (version, markers) in jobs.items():
+                started = time.time()
+                self._store(hide, version, self.renderer(markers))
+                logging.info(f"Map re-rendered for hidden layers {list(hide)} in {time.time() - started:.2f}s")
+
+    def get(self, hide, markers):
+        """HTML for this marker set if rendered, else the latest finished render for the layer set"""
+        version = self.version(markers)
+        with self.lock:
+            html = self.renders.get((hide, version))
+            if html is not None:
+                self.renders.move_to_end((hide, version))
+                return html
+            latest = self.latest.get(hide)
+            if latest is not None:
+                self.pending[hide] = (version, markers)
+                if self.worker is None:
+                    self.worker = threading.Thread(target=self._run, name='map-renderer', daemon=True)
+                    self.worker.start()
+                self.wakeup.set()
+                return latest[1]
+        html = self.renderer(markers)
+        self._store(hide, version, html)
+        return html
+
+map_renders = MapRenderCache()
+
+GEO_CLUSTER_CELLS_PER_TILE = 4   # Grid cells per 256px map tile edge (~64px clusters)
+GEO_CLUSTER_MAX_ZOOM = 18
+GEO_CLUSTER_DEFAULT_ZOOM = 2     # Same initial zoom as the folium map
+GEO_CLUSTER_LIMIT = 500          # Largest clusters returned, whatever the number of points
+GEO_CLUSTER_TOP_N = 5          # Top countries / sample IPs listed per cluster
+GEO_TYPE_STYLES = {  # type -> (label, color)
+    'ssh_success': ('SSH Exitosa', 'green'),
+    'ssh_attack': ('Ataque SSH', 'red'),
+    'openproject': ('OpenProject', 'orange'),
+    'web_active': ('Conexión Web Activa', 'blue'),
+}
+
+def parse_geo_view(args):
+    """Read `zoom` and `bbox=west,south,east,north` query parameters (ValueError if malformed)"""
+    zoom_error = f"zoom must be an integer between 0 and {GEO_CLUSTER_MAX_ZOOM}"
+    zoom = GEO_CLUSTER_DEFAULT_ZOOM
+    if args.get('zoom'):
+        try:
+            zoom = int(args['zoom'])
+        except ValueError:
+            raise ValueError(zoom_error)
+    if not 0 <= zoom <= GEO_CLUSTER_MAX_ZOOM:
+        raise ValueError(zoom_error)
+    bbox = args.get('bbox')
+    if bbox:
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(','))
+        except ValueError:
+            raise ValueError("bbox must be west,south,east,north in degrees")
+        if south > north:
+            raise ValueError("bbox south must not be greater than north")
+        bbox = (west, south, east, north)
+    return zoom, bbox
+
+def _in_bbox(lat, lon, bbox):
+    west, south, east, north = bbox
+    if not south <= lat <= north:
+        return False
+    # west > east means the box crosses the antimeridian
+    return west <= lon <= east if west <= east else lon >= west or lon <= east
+
+def cluster_geo_points(points, zoom, bbox=None):
+    """Grid-cluster (lat, lon, type, ip, country, count) points for a zoom level.
+
+    Returns at most GEO_CLUSTER_LIMIT clusters (largest first), each with its
+    count-weighted centroid, per-type breakdown, dominant type, top countries
+    and a sample of its IPs.
+    """
+    cell_size = 360.0 / (2 ** zoom * GEO_CLUSTER_CELLS_PER_TILE)
+    cells = {}
+    for lat, lon, marker_type, ip, country, count in points:
+        if bbox and not _in_bbox(lat, lon, bbox):
+            continue
+        key = (math.floor(lon / cell_size), math.floor(lat / cell_size))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0,
+                                 'types': Counter(), 'countries': Counter(), 'ips': Counter()}
+        cell['count'] += count
+        cell['lat_sum'] += lat * count
+        cell['lon_sum'] += lon * count
+        cell['types'][marker_type] += count
+        cell['countries'][country] += count
+        cell['ips'][ip] += count
+
+    largest = sorted(cells.values(), key=lambda c: c['count'], reverse=True)[:GEO_CLUSTER_LIMIT]
+    clusters = []
+    for cell in largest:
+        dominant_type = cell['types'].most_common(1)[0][0]
+        label, color = GEO_TYPE_STYLES[dominant_type]
+        breakdown = ', '.join(f"{GEO_TYPE_STYLES[t][0]}: {n}" for t, n in cell['types'].most_common())
+        clusters.append({
+            'lat': round(cell['lat_sum'] / cell['count'], 5),
+            'lon': round(cell['lon_sum'] / cell['count'], 5),
+            'count': cell['count'],
+            'type': dominant_type,
+            'types': dict(cell['types']),
+            'color': color,
+            'country': cell['countries'].most_common(1)[0][0],
+            'countries': dict(cell['countries'].most_common(GEO_CLUSTER_TOP_N)),
+            'ip_count': len(cell['ips']),
+            'ips': [ip for ip, _ in cell['ips'].most_common(GEO_CLUSTER_TOP_N)],
+            'description': f"{breakdown} desde {len(cell['ips'])} IP(s)",
+        })
+    return clusters
+
 def create_enhanced_map(ssh_attacks, ssh_successful, openproject_access, active_ssh, active_web, active_layers):
     """Create an enhanced map with layer controls and better visualizations"""
     try:
         m = folium.Map(location=[20, 0], zoom_start=2)
-        trusted_ips = load_trusted_ips()
         
         # Layer 1: Trusted IPs (IP Autorizada) - Special icon
         if 'trustedIPs' in active_layers:
@@ -924,7 +2607,7 @@ def create_enhanced_map(ssh_attacks, ssh_successful, openproject_access, active_
             all_ips.extend([session.get('ip', '') for session in active_ssh.get('user_sessions', [])])
             
             for ip in set(all_ips):
-                if ip in trusted_ips.get('ips', []):
+                if trusted_registry.is_trusted(ip):
                     geo_info = get_geo_info(ip)
                     if geo_info['lat'] != 0 and geo_info['lon'] != 0:
                         folium.Marker(
@@ -942,7 +2625,7 @@ def create_enhanced_map(ssh_attacks, ssh_successful, openproject_access, active_
                     attack_counts[(geo_info['lat'], geo_info['lon'], attack['ip'])] += 1
             
             for (lat, lon, ip), count in attack_counts.items():
-                if ip not in trusted_ips.get('ips', []):  # Don't show attacks from trusted IPs
+                if not trusted_registry.is_trusted(ip):  # Don't show attacks from trusted IPs
                     # Scale circle size by attack count (min 5, max 25)
                     radius = min(max(count * 3, 5), 25)
                     folium.CircleMarker(
@@ -981,7 +2664,7 @@ def create_enhanced_map(ssh_attacks, ssh_successful, openproject_access, active_
             for conn in active_web:
                 geo_info = get_geo_info(conn['remote_ip'])
                 if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                    is_trusted = conn['remote_ip'] in trusted_ips.get('ips', [])
+                    is_trusted = trusted_registry.is_trusted(conn['remote_ip'])
                     if not is_trusted:  # Don't duplicate trusted IP markers
                         folium.CircleMarker(
                             location=[geo_info['lat'], geo_info['lon']],
@@ -999,6 +2682,390 @@ def create_enhanced_map(ssh_attacks, ssh_successful, openproject_access, active_
         logging.error(f"Error creating enhanced map: {e}")
         return "<p>Error generando mapa mejorado</p>"
 
+# Result of one collector run. Routes must treat `value` as read-only: it is
+# shared by every request until the next run replaces the whole snapshot.
+Snapshot = namedtuple('Snapshot', ['value', 'updated_at', 'duration', 'error'])
+
+class CollectorScheduler:
+    """Runs each collector on its own interval and publishes its latest snapshot.
+
+    Flask routes only read snapshots, so request latency no longer depends on
+    journalctl/docker/psql/fail2ban-client latency. Until start() is called
+    (e.g. when imported by another process) snapshots are refreshed on demand
+    once they are older than the collector's interval.
+    """
+
+    def __init__(self):
+        self.collectors = {}  # name -> (func, interval)
+        self.snapshots = {}   # name -> Snapshot (replaced atomically, never mutated)
+        self.run_locks = {}
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.listeners = []
+        self.stats = {}       # name -> {'runs', 'errors', 'seconds'} since start (for /metrics)
+        self.latency = {}     # name -> LatencyHistogram of run durations
+
+    def subscribe(self, callback):
+        """Call callback(name, snapshot) after every successful collector run"""
+        self.listeners.append(callback)
+
+    def register(self, name, func, interval):
+        self.collectors[name] = (func, interval)
+        self.run_locks[name] = threading.RLock()
+        self.stats[name] = {'runs': 0, 'errors': 0, 'seconds': 0.0}
+        self.latency[name] = LatencyHistogram()
+
+    def run_collector(self, name):
+        """Run a collector now and publish its snapshot"""
+        func, _ = self.collectors[name]
+        with self.run_locks[name]:
+            started = time.time()
+            try:
+                value = func()
+                error = None
+            except Exception as e:
+                logging.error(f"Collector {name} failed: {e}")
+                previous = self.snapshots.get(name)
+                value = previous.value if previous else None
+                error = str(e)
+            snapshot = Snapshot(value, time.time(), time.time() - started, error)
+            self.snapshots[name] = snapshot
+            stats = self.stats[name]
+            stats['runs'] += 1
+            stats['seconds'] += snapshot.duration
+            self.latency[name].record(snapshot.duration)
+            if error is not None:
+                stats['errors'] += 1
+        if error is None:
+            for callback in self.listeners:
+                try:
+                    callback(name, snapshot)
+                except Exception as e:
+                    logging.error(f"Collector listener failed: {e}")
+        return snapshot
+
+    def get_snapshot(self, name):
+        """Get the latest snapshot, collecting synchronously only if there is none yet"""
+        snapshot = self.snapshots.get(name)
+        _, interval = self.collectors[name]
+        if snapshot is None or (not self.threads and time.time() - snapshot.updated_at > interval):
+            with self.run_locks[name]:
+                current = self.snapshots.get(name)
+                if current is snapshot:  # Nobody refreshed it while we waited
+                    current = self.run_collector(name)
+                return current
+        return snapshot
+
+    def get(self, name):
+        """Get the latest collected value"""
+        snapshot = self.get_snapshot(name)
+        if has_request_context():
+            # Newest snapshot a response was built from becomes its Last-Modified
+            g.data_updated_at = max(g.get('data_updated_at', 0), snapshot.updated_at)
+        return snapshot.value
+
+    def _loop(self, name):
+        _, interval = self.collectors[name]
+        while not self.stop_event.is_set():
+            self.run_collector(name)
+            self.stop_event.wait(interval)
+
+    def start(self):
+        """Start one daemon thread per collector (idempotent)"""
+        if self.threads:
+            return
+        for name in self.collectors:
+            thread = threading.Thread(target=self._loop, args=(name,), name=f"collector-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logging.info(f"Background collectors started: {', '.join(self.collectors)}")
+
+    def stop(self):
+        self.stop_event.set()
+
+collectors = CollectorScheduler()
+
+STREAM_EVENT_TYPES = {'ssh_attack', 'ssh_success', 'f2b_ban', 'f2b_unban', 'op_failed_login', 'unit_state',
+                      'intrusion_alert'}
+STREAM_COLLECTORS = {'system_status': 'server_status', 'active_ssh': 'ssh_sessions'}  # collector -> SSE event
+STREAM_CLIENT_QUEUE_SIZE = 256   # Messages buffered per client before it is considered lagging
+STREAM_RESUME_LIMIT = 1000       # Max stored events replayed on resume; beyond that the client resyncs
+STREAM_KEEPALIVE_SECONDS = 15
+
+def format_sse(event_name, payload, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_name}")
+    lines.append(f"data: {json.dumps(payload, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+class StreamClient:
+    """Bounded per-client queue; a slow client drops its backlog instead of blocking publishers"""
+
+    def __init__(self, size=STREAM_CLIENT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=size)
+        self.lagged = threading.Event()
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Drop the backlog: stored events are replayed from the last delivered id
+            self.lagged.set()
+            with self.queue.mutex:
+                self.queue.queue.clear()
+
+class EventStream:
+    """Fans stored events and collector snapshots out to /api/stream clients.
+
+    Stored events carry their event store id as the SSE id, so a reconnecting
+    EventSource (Last-Event-ID) or a client that fell behind is caught up from
+    the store. Collector snapshots are state, not history: only the latest is
+    sent and they carry no id.
+    """
+
+    def __init__(self, store, scheduler):
+        self.store = store
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.last_values = {}  # collector -> last published value
+        store.subscribe(self.publish_events)
+        scheduler.subscribe(self.publish_snapshot)
+
+    def _broadcast(self, message):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.put(message)
+
+    def publish_events(self, events):
+        if not self.clients:
+            return
+        for event in events:
+            if event['event_type'] in STREAM_EVENT_TYPES:
+                payload = {**event['data'], 'id': event['id'], 'event_type': event['event_type'],
+                           'country': event.get('country')}
+                self._broadcast((event['id'], event['event_type'], payload))
+
+    def publish_snapshot(self, name, snapshot):
+        if name not in STREAM_COLLECTORS or self.last_values.get(name) == snapshot.value:
+            return  # Only push state that actually changed
+        self.last_values[name] = snapshot.value
+        if self.clients:
+            self._broadcast((None, STREAM_COLLECTORS[name], snapshot.value))
+
+    def _replay(self, after_id):
+        """Stored events after `after_id`, or None if there are too many to replay"""
+        events = self.store.query_events(event_types=sorted(STREAM_EVENT_TYPES), after_id=after_id,
+                                         limit=STREAM_RESUME_LIMIT + 1, order_by_id=True)
+        return None if len(events) > STREAM_RESUME_LIMIT else events
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE messages for one client"""
+        client = StreamClient()
+        with self.lock:
+            self.clients.add(client)
+        try:
+            yield "retry: 5000\n\n"
+            last_id = last_event_id
+            if last_id is None:
+                # Fresh client: stream from now, starting with the current state of each streamed collector
+                last_id = self.store.latest_id()
+                for name, event_name in STREAM_COLLECTORS.items():
+                    snapshot = collectors.snapshots.get(name)
+                    if snapshot is not None:
+                        yield format_sse(event_name, snapshot.value)
+            else:
+                client.lagged.set()
+            while True:
+                if client.lagged.is_set():
+                    client.lagged.clear()
+                    events = self._replay(last_id)
+                    if events is None:
+                        # Too far behind: tell the dashboard to refetch everything over REST
+                        last_id = self.store.latest_id()
+                        yield format_sse('resync', {'reason': 'backlog'}, last_id)
+                    else:
+                        for event in events:
+                            last_id = event['id']
+                            yield format_sse(event['event_type'], event, event['id'])
+                try:
+                    event_id, event_name, payload = client.queue.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event_id is not None:
+                    if event_id <= last_id:
+                        continue  # Already delivered by a replay
+                    last_id = event_id
+                yield format_sse(event_name, payload, event_id)
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+
+event_stream = EventStream(event_store, collectors)
+
+class EventCounters:
+    """Cumulative per-type counts of stored events since startup (Prometheus counters)"""
+
+    def __init__(self, store):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        store.subscribe(self.add_events)
+
+    def add_events(self, events):
+        with self.lock:
+            self.counts.update(event['event_type'] for event in events)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+event_counters = EventCounters(event_store)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _prometheus_metric(lines, name, metric_type, help_text, samples):
+    """Append one metric family in Prometheus text format; samples: [(labels dict, value)]"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{k}="{_prometheus_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+
+def render_prometheus_metrics():
+    """Exposition built only from counters and the latest snapshots: never runs a collector"""
+    lines = []
+    snapshot_value = lambda name, default: getattr(collectors.snapshots.get(name), 'value', None) or default
+
+    counts = event_counters.snapshot()
+    _prometheus_metric(lines, 'ssh_monitor_events_total', 'counter',
+                       'Security events ingested since startup, by type',
+                       [({'type': t}, counts.get(t, 0)) for t in sorted(
+                           set(SSH_EVENT_TYPES.values()) | set(OPENPROJECT_EVENT_TYPES.values()) |
+                           {'f2b_ban', 'f2b_unban'} | set(counts))])
+    _prometheus_metric(lines, 'ssh_monitor_ssh_failed_logins_total', 'counter',
+                       'SSH authentication failures since startup', [({}, counts.get(SSH_EVENT_TYPES['attack'], 0))])
+    _prometheus_metric(lines, 'ssh_monitor_ssh_successful_logins_total', 'counter',
+                       'Accepted SSH logins since startup', [({}, counts.get(SSH_EVENT_TYPES['success'], 0))])
+    _prometheus_metric(lines, 'ssh_monitor_openproject_failed_logins_total', 'counter',
+                       'OpenProject failed logins since startup',
+                       [({}, counts.get(OPENPROJECT_EVENT_TYPES['failed_login'], 0))])
+    _prometheus_metric(lines, 'ssh_monitor_fail2ban_bans_total', 'counter',
+                       'fail2ban bans observed since startup', [({}, counts.get('f2b_ban', 0))])
+
+    fail2ban = snapshot_value('fail2ban', {'banned_ips': []})
+    active_ssh = snapshot_value('active_ssh', {'user_sessions': [], 'network_connections': []})
+    _prometheus_metric(lines, 'ssh_monitor_fail2ban_banned_ips', 'gauge',
+                       'IPs currently banned by the sshd jail', [({}, len(fail2ban['banned_ips']))])
+    _prometheus_metric(lines, 'ssh_monitor_ssh_sessions', 'gauge', 'Active SSH sessions', [
+        ({'kind': 'user'}, len(active_ssh['user_sessions'])),
+        ({'kind': 'network'}, len(active_ssh['network_connections'])),
+    ])
+    _prometheus_metric(lines, 'ssh_monitor_web_connections', 'gauge', 'Established HTTP/HTTPS connections',
+                       [({}, len(snapshot_value('active_web', [])))])
+    _prometheus_metric(lines, 'ssh_monitor_openproject_active_users', 'gauge', 'OpenProject users active in the last hour',
+                       [({}, len(snapshot_value('op_active_users', [])))])
+
+    sample = metrics_sampler.ring.latest()
+    if sample:
+        _prometheus_metric(lines, 'ssh_monitor_system_usage_percent', 'gauge', 'Latest CPU/memory/disk usage sample',
+                           [({'resource': r}, round(sample[r], 2)) for r in ('cpu', 'memory', 'disk')])
+        _prometheus_metric(lines, 'ssh_monitor_system_load1', 'gauge', '1-minute load average', [({}, sample['load'])])
+        _prometheus_metric(lines, 'ssh_monitor_sockets', 'gauge', 'Open TCP/UDP sockets', [({}, int(sample['connections']))])
+
+    stats = {name: dict(values) for name, values in collectors.stats.items()}
+    _prometheus_metric(lines, 'ssh_monitor_collector_runs_total', 'counter', 'Collector runs since startup',
+                       [({'collector': n}, v['runs']) for n, v in stats.items()])
+    _prometheus_metric(lines, 'ssh_monitor_collector_errors_total', 'counter', 'Collector runs that raised',
+                       [({'collector': n}, v['errors']) for n, v in stats.items()])
+    _prometheus_metric(lines, 'ssh_monitor_collector_duration_seconds_total', 'counter', 'Time spent running collectors',
+                       [({'collector': n}, round(v['seconds'], 6)) for n, v in stats.items()])
+    snapshots = dict(collectors.snapshots)
+    _prometheus_metric(lines, 'ssh_monitor_collector_last_duration_seconds', 'gauge', 'Duration of the latest run',
+                       [({'collector': n}, round(snap.duration, 6)) for n, snap in snapshots.items()])
+    _prometheus_metric(lines, 'ssh_monitor_collector_last_run_timestamp_seconds', 'gauge',
+                       'Unix time of the latest run', [({'collector': n}, round(snap.updated_at, 3)) for n, snap in snapshots.items()])
+
+    calls = {label: stats.summary() for label, stats in list(call_stats.items())}
+    _prometheus_metric(lines, 'ssh_monitor_external_calls_total', 'counter',
+                       'Subprocess, Docker API and PostgreSQL calls by command and exit code',
+                       [({'command': label, 'exit_code': code}, n)
+                        for label, c in calls.items() for code, n in c['exit_codes'].items()])
+    _prometheus_metric(lines, 'ssh_monitor_external_call_timeouts_total', 'counter', 'External calls that timed out',
+                       [({'command': label}, c['timeouts']) for label, c in calls.items()])
+    _prometheus_metric(lines, 'ssh_monitor_external_call_output_bytes_total', 'counter', 'Bytes returned by external calls',
+                       [({'command': label}, c['output_bytes']) for label, c in calls.items()])
+
+    geo = get_geo_cache_stats()
+    _prometheus_metric(lines, 'ssh_monitor_geoip_cache_lookups_total', 'counter', 'GeoIP cache lookups', [
+        ({'result': 'hit'}, geo['hits']), ({'result': 'miss'}, geo['misses'])])
+    _prometheus_metric(lines, 'ssh_monitor_stream_clients', 'gauge', 'Connected /api/stream clients',
+                       [({}, len(event_stream.clients))])
+    _prometheus_metric(lines, 'ssh_monitor_status_probes_overdue', 'gauge',
+                       'Status probes still running after their round deadline', [({}, len(overdue_probes))])
+    return '\n'.join(lines) + '\n'
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv'}
+COMPRESS_MIN_SIZE = 1024           # Bytes; smaller bodies are sent as-is
+COMPRESSED_CACHE_SIZE = 64         # Compressed bodies kept per (ETag, encoding)
+
+_compressed_cache = OrderedDict()
+_compressed_cache_lock = threading.Lock()
+
+def _preferred_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress_body(etag, encoding, data):
+    """Compress a body once per (ETag, encoding): unchanged polled responses reuse it"""
+    key = (etag, encoding)
+    with _compressed_cache_lock:
+        if key in _compressed_cache:
+            _compressed_cache.move_to_end(key)
+            return _compressed_cache[key]
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=5)
+    else:
+        compressed = gzip.compress(data, compresslevel=6)
+    with _compressed_cache_lock:
+        _compressed_cache[key] = compressed
+        while len(_compressed_cache) > COMPRESSED_CACHE_SIZE:
+            _compressed_cache.popitem(last=False)
+    return compressed
+
+@app.after_request
+def conditional_and_compressed_response(response):
+    """Content-hash ETag / Last-Modified with 304 support, then gzip or brotli"""
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.add_etag()
+    if g.get('data_updated_at'):
+        response.last_modified = datetime.fromtimestamp(g.data_updated_at, timezone.utc)
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = _preferred_encoding() if len(data) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        etag, _ = response.get_etag()
+        # Each encoding is a distinct representation and needs its own strong ETag
+        response.set_etag(f"{etag}-{encoding}")
+    response.make_conditional(request)
+    if encoding and response.status_code == 200:
+        response.set_data(_compress_body(etag, encoding, data))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/')
 def api_root():
     """API Root - Backend Status"""
@@ -1037,9 +3104,10 @@ def api_health():
             "uptime": "running",
             "services": {
                 "flask": "running",
-                "geoip": os.path.exists('/opt/ssh-monitor/GeoLite2-City.mmdb'),
+                "geoip": os.path.exists(GEOIP_DB_PATH),
                 "logs": "accessible"
-            }
+            },
+            "geoip_cache": get_geo_cache_stats()
         })
     except Exception as e:
         return jsonify({
@@ -1048,75 +3116,260 @@ def api_health():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: new SSH attacks/logins, fail2ban bans and status samples as they happen"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return Response(event_stream.stream(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_COLUMNS = ['id', 'time', 'ts', 'event_type', 'source', 'ip', 'user', 'country', 'data']
+EXPORT_BATCH_SIZE = 5000  # Rows per store query and per yielded chunk
+
+def export_chunks(rows, fmt):
+    """Encode rows as NDJSON or CSV text, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        record = {
+            'id': row['id'],
+            'time': datetime.fromtimestamp(row['ts'], timezone.utc).isoformat(),
+            'ts': row['ts'],
+            'event_type': row['event_type'],
+            'source': row['source'],
+            'ip': row['ip'],
+            'user': row['user'],
+            'country': row['country']
+        }
+        if writer:
+            writer.writerow([*record.values(), row['data']])
+        else:
+            buffer.write(json.dumps({**record, 'data': json.loads(row['data'])}, default=str))
+            buffer.write('\n')
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    """Stream-compress text chunks into one gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export')
+def api_export():
+    """Stream stored events as NDJSON or CSV (optionally gzipped) for any time range and type filter"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_time_param(request.args['since']) if request.args.get('since') else time.time() - EVENT_PAGE_DEFAULT_HOURS * 3600
+        until = parse_time_param(request.args['until']) if request.args.get('until') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    event_types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()]
+    rows = event_store.iter_rows(EXPORT_BATCH_SIZE, since=since, until=until, event_types=event_types,
+                                 ip=request.args.get('ip'), user=request.args.get('user'),
+                                 country=request.args.get('country'))
+    chunks = export_chunks(rows, fmt)
+    filename = f"events-{datetime.fromtimestamp(since).strftime('%Y%m%d%H%M')}.{fmt}"
+    mimetype = EXPORT_FORMATS[fmt]
+    if request.args.get('gzip') in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of security counters and collector statistics"""
+    return Response(render_prometheus_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/debug/collectors')
+def api_debug_collectors():
+    """Per-collector and per-command latency percentiles, exit codes, timeouts and output sizes"""
+    now = time.time()
+    result = {'collectors': {}, 'calls': {}}
+    for name, (_, interval) in collectors.collectors.items():
+        snapshot = collectors.snapshots.get(name)
+        result['collectors'][name] = {
+            'interval': interval,
+            **collectors.stats[name],
+            'latency': collectors.latency[name].summary(),
+            'last_run_age': round(now - snapshot.updated_at, 3) if snapshot else None,
+            'last_duration': round(snapshot.duration, 6) if snapshot else None,
+            'last_error': snapshot.error if snapshot else None,
+        }
+    for label, stats in sorted(call_stats.items()):
+        result['calls'][label] = stats.summary()
+    return jsonify(result)
+
 @app.route('/api/summary')
 def api_summary():
     """API endpoint for enhanced summary statistics including SSH and OpenProject"""
     try:
-        # SSH Data (existing)
-        ssh_entries = get_ssh_log_entries(24)
-        active_ssh = get_active_ssh_sessions()
-        fail2ban_data = get_fail2ban_status()
-        
-        ssh_attacks = [e for e in ssh_entries if e['type'] == 'attack']
-        ssh_successful = [e for e in ssh_entries if e['type'] == 'success']
+        hours = float(request.args.get('hours') or 24)
+        if not 0 < hours < math.inf:  # Also rejects nan
+            raise ValueError(hours)
+    except ValueError:
+        return jsonify({'error': "hours must be a positive number"}), 400
+    try:
+        # Weekly or monthly windows are fine: capped only by the event store's retention
+        hours = min(hours, event_store.retention_seconds / 3600)
+        since = time.time() - hours * 3600
+
+        # Counts and distinct IPs/users/countries come from the rollups, not a scan of the events
+        ssh_types = [SSH_EVENT_TYPES['attack'], SSH_EVENT_TYPES['success']]
+        counts = rollups.counts(since, event_types=ssh_types + [OPENPROJECT_EVENT_TYPES['failed_login']])
+        ssh_attack_count = counts[SSH_EVENT_TYPES['attack']]
+        ssh_success_count = counts[SSH_EVENT_TYPES['success']]
+        op_failed_count = counts[OPENPROJECT_EVENT_TYPES['failed_login']]
+        unique_ips = rollups.sketch(since, event_types=ssh_types)
+        unique_ips_total = unique_ips.count()
+        unique_users_total = rollups.distinct(since, event_types=ssh_types, dimension='user')
+        unique_countries_total = rollups.distinct(since, event_types=ssh_types, dimension='country')
+
+        active_ssh = collectors.get('active_ssh')
+        fail2ban_data = collectors.get('fail2ban')
         total_ssh_active = len(active_ssh['user_sessions']) + len(active_ssh['network_connections'])
         
-        # Calculate unique IPs (for the 4th metric block)
-        unique_ips_attacks = len(set(e['ip'] for e in ssh_attacks))
-        unique_ips_successful = len(set(e['ip'] for e in ssh_successful))
-        unique_ips_total = len(set(e['ip'] for e in ssh_entries))
-        
         # OpenProject Data (new and improved)
-        op_failed_logins = get_openproject_failed_logins(24)
-        op_successful_logins = get_openproject_successful_logins(24)
-        op_active_users = get_openproject_active_users(1)
-        active_web = get_active_web_connections()
-        intrusion_data = detect_potential_intruders()
+        op_successful_logins = collectors.get('op_successful_logins')
+        op_active_users = collectors.get('op_active_users')
+        active_web = collectors.get('active_web')
+        intrusion_data = collectors.get('intrusion')
         
         summary = {
             # SSH Server Monitoring (24h)
-            'ssh_failed_logins': len(ssh_attacks),
-            'ssh_successful_logins': len(ssh_successful),
+            'ssh_failed_logins': ssh_attack_count,
+            'ssh_successful_logins': ssh_success_count,
             'ssh_active_connections': total_ssh_active,
             'ssh_blocked_ips': len(fail2ban_data['banned_ips']),
             'ssh_unique_ips': unique_ips_total,  # New metric for 4th block
+            'ssh_unique_users': unique_users_total,
+            'ssh_unique_countries': unique_countries_total,
+            'unique_counts_error': round(2 * unique_ips.relative_error, 3),  # ~95% relative bound of the unique_* estimates
+            'window_hours': hours,
             
             # OpenProject Application Monitoring (24h)
-            'op_failed_logins': len(op_failed_logins),
+            'op_failed_logins': op_failed_count,
             'op_successful_logins': len(op_successful_logins),
             'op_active_users': len(op_active_users),
             'op_blocked_users': 0,  # Placeholder - OpenProject doesn't have built-in user blocking
             
             # Security Analysis
             'total_registered_users': intrusion_data['total_registered'],
-            'potential_security_alerts': len(intrusion_data['alerts']),
+            'potential_security_alerts': len(intrusion_data['alerts']) + len(brute_force.alerts()),
             'total_active_connections': total_ssh_active + len(active_web),
             
             # Legacy compatibility (for existing frontend)
-            'ssh_attacks_24h': len(ssh_attacks),
-            'ssh_successful_24h': len(ssh_successful),
+            'ssh_attacks_24h': ssh_attack_count,
+            'ssh_successful_24h': ssh_success_count,
             'op_active_connections': len(active_web)
         }
         
-        logging.info(f"Enhanced API Summary: SSH({len(ssh_attacks)} attacks, {len(ssh_successful)} success), OP({len(op_failed_logins)} failed, {len(op_successful_logins)} success, {len(op_active_users)} active)")
+        logging.info(f"Enhanced API Summary: SSH({ssh_attack_count} attacks, {ssh_success_count} success), OP({op_failed_count} failed, {len(op_successful_logins)} success, {len(op_active_users)} active)")
         return jsonify(summary)
     except Exception as e:
         logging.error(f"Error in summary API: {e}")
         return jsonify({'error': str(e)}), 500
 
+EVENT_PAGE_MAX_LIMIT = 1000
+EVENT_PAGE_DEFAULT_HOURS = 24  # Window searched when `since` is not given
+
+def encode_cursor(key):
+    """(ts, id) page key -> opaque URL-safe token"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        ts, event_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return float(ts), int(event_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+MAX_TIME_PARAM = datetime(9999, 1, 1, tzinfo=timezone.utc).timestamp()  # Stays within datetime's range in any timezone
+
+def parse_time_param(value):
+    """Epoch seconds, a relative age ('90m', '2h', '7d' ago) or an ISO 8601 datetime -> epoch"""
+    value = value.strip()
+    if re.fullmatch(r'\d+(?:\.\d+)?[smhd]', value):
+        ts = time.time() - parse_duration(value, 0)
+    else:
+        try:
+            ts = float(value)
+        except ValueError:
+            try:
+                ts = datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                raise ValueError(f"Invalid time: {value}")
+    # Rejects nan/inf and values datetime.fromtimestamp() cannot represent
+    if not 0 <= ts <= MAX_TIME_PARAM:
+        raise ValueError(f"Time out of range: {value}")
+    return ts
+
+def parse_event_query(args, default_limit, status_field=None):
+    """Filters, page size and cursor of an event list request (raises ValueError -> 400)"""
+    since = args.get('since')
+    until = args.get('until')
+    query = {
+        'since': parse_time_param(since) if since else time.time() - EVENT_PAGE_DEFAULT_HOURS * 3600,
+        'until': parse_time_param(until) if until else None,
+        'ip': args.get('ip'),
+        'user': args.get('user'),
+        'country': args.get('country'),
+        'limit': default_limit
+    }
+    limit_error = f"limit must be an integer between 1 and {EVENT_PAGE_MAX_LIMIT}"
+    if args.get('limit'):
+        try:
+            query['limit'] = int(args['limit'])
+        except ValueError:
+            raise ValueError(limit_error)
+    if not 1 <= query['limit'] <= EVENT_PAGE_MAX_LIMIT:
+        raise ValueError(limit_error)
+    if args.get('status'):
+        if status_field is None:
+            raise ValueError("status filter is not supported here")
+        query['data_filters'] = {status_field: args['status']}
+    if args.get('cursor'):
+        query['before'] = decode_cursor(args['cursor'])
+    return query
+
+def event_page_response(event_types, default_limit, status_field=None, fields=('country', 'is_trusted')):
+    """JSON list of one page of stored events, oldest first; the next (older) page's cursor goes in X-Next-Cursor"""
+    try:
+        query = parse_event_query(request.args, default_limit, status_field)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    events, next_key = event_store.page_events(event_types=event_types, **query)
+    response = jsonify(enrich_events(events, fields=fields))
+    if next_key is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_key)
+    return response
+
 @app.route('/api/ssh/attacks')
 def api_ssh_attacks():
     """API endpoint for SSH attack data"""
     try:
-        entries = get_ssh_log_entries(24)
-        attacks = [e for e in entries if e['type'] == 'attack']
-        
-        for attack in attacks:
-            geo_info = get_geo_info(attack['ip'])
-            attack['country'] = geo_info['country']
-        
-        logging.info(f"API SSH Attacks: {len(attacks)} attacks")
-        return jsonify(attacks[-100:])
+        collectors.get('ssh_entries')  # Journal entries are ingested into the store by the collector
+        return event_page_response([SSH_EVENT_TYPES['attack']], 100, status_field='event', fields=('country',))
     except Exception as e:
         logging.error(f"Error in SSH attacks API: {e}")
         return jsonify([])
@@ -1125,16 +3378,8 @@ def api_ssh_attacks():
 def api_ssh_successful():
     """API endpoint for successful SSH connections"""
     try:
-        entries = get_ssh_log_entries(24)
-        successful = [e for e in entries if e['type'] == 'success']
-        trusted_ips = load_trusted_ips()
-        
-        for conn in successful:
-            geo_info = get_geo_info(conn['ip'])
-            conn['country'] = geo_info['country']
-            conn['is_trusted'] = conn['ip'] in trusted_ips.get('ips', [])
-        
-        return jsonify(successful[-50:])
+        collectors.get('ssh_entries')
+        return event_page_response([SSH_EVENT_TYPES['success']], 50, status_field='auth_type')
     except Exception as e:
         logging.error(f"Error in SSH successful API: {e}")
         return jsonify([])
@@ -1143,7 +3388,7 @@ def api_ssh_successful():
 def api_ssh_active():
     """API endpoint for active SSH sessions"""
     try:
-        return jsonify(get_active_ssh_sessions())
+        return jsonify(collectors.get('active_ssh'))
     except Exception as e:
         logging.error(f"Error in SSH active API: {e}")
         return jsonify({'user_sessions': [], 'network_connections': []})
@@ -1152,19 +3397,8 @@ def api_ssh_active():
 def api_openproject_access():
     """API endpoint for OpenProject access logs"""
     try:
-        entries, _ = get_openproject_logs(24)
-        trusted_ips = load_trusted_ips()
-        
-        for entry in entries:
-            if entry['ip'] != 'unknown':
-                geo_info = get_geo_info(entry['ip'])
-                entry['country'] = geo_info['country']
-                entry['is_trusted'] = entry['ip'] in trusted_ips.get('ips', [])
-            else:
-                entry['country'] = 'Unknown'
-                entry['is_trusted'] = False
-        
-        return jsonify(entries[-100:])
+        collectors.get('openproject_logs')
+        return event_page_response([OPENPROJECT_EVENT_TYPES['access']], 100, status_field='status')
     except Exception as e:
         logging.error(f"Error in OpenProject access API: {e}")
         return jsonify([])
@@ -1173,19 +3407,8 @@ def api_openproject_access():
 def api_openproject_users():
     """API endpoint for OpenProject active users"""
     try:
-        _, users = get_openproject_logs(24)
-        trusted_ips = load_trusted_ips()
-        
-        for user in users:
-            if user['ip'] != 'unknown':
-                geo_info = get_geo_info(user['ip'])
-                user['country'] = geo_info['country']
-                user['is_trusted'] = user['ip'] in trusted_ips.get('ips', [])
-            else:
-                user['country'] = 'Unknown'
-                user['is_trusted'] = False
-        
-        return jsonify(users)
+        _, users = collectors.get('openproject_logs')
+        return jsonify(enrich_events(users))
     except Exception as e:
         logging.error(f"Error in OpenProject users API: {e}")
         return jsonify([])
@@ -1194,7 +3417,7 @@ def api_openproject_users():
 def api_openproject_connections():
     """API endpoint for active web connections"""
     try:
-        return jsonify(get_active_web_connections())
+        return jsonify(collectors.get('active_web'))
     except Exception as e:
         logging.error(f"Error in web connections API: {e}")
         return jsonify([])
@@ -1203,7 +3426,7 @@ def api_openproject_connections():
 def api_fail2ban():
     """API endpoint for fail2ban status"""
     try:
-        return jsonify(get_fail2ban_status())
+        return jsonify(collectors.get('fail2ban'))
     except Exception as e:
         logging.error(f"Error in fail2ban API: {e}")
         return jsonify({'banned_ips': [], 'stats': {'jail_status': 'Error', 'total_banned': 0}})
@@ -1213,10 +3436,11 @@ def api_map():
     """API endpoint for the combined world map with filtering support"""
     try:
         # Get filter parameters
-        hide_params = request.args.getlist('hide')
+        # Only known layers: every distinct layer set is a cache key and a render of its own
+        hide_params = [layer for layer in request.args.getlist('hide') if layer in MAP_LAYERS]
         
-        ssh_entries = get_ssh_log_entries(24)
-        op_entries, _ = get_openproject_logs(24)
+        ssh_entries = collectors.get('ssh_entries')
+        op_entries, _ = collectors.get('openproject_logs')
         
         ssh_attacks = [e for e in ssh_entries if e['type'] == 'attack'] if 'ssh_attacks' not in hide_params else []
         ssh_successful = [e for e in ssh_entries if e['type'] == 'success'] if 'ssh_successful' not in hide_params else []
@@ -1225,18 +3449,16 @@ def api_map():
         logging.info(f"SSH attacks found: {len(ssh_attacks)}, SSH successful: {len(ssh_successful)}")
         
         # Active SSH incluido en ssh_successful (no filtro separado)
-        active_ssh = get_active_ssh_sessions() if 'ssh_successful' not in hide_params else {}
-        active_web = get_active_web_connections() if 'https' not in hide_params else []
+        active_ssh = collectors.get('active_ssh') if 'ssh_successful' not in hide_params else {}
+        active_web = collectors.get('active_web') if 'https' not in hide_params else []
         
         # Filter OpenProject if requested
         if 'openproject' in hide_params:
             op_entries = []
         
-        # Create map with selected layers
-        map_html = create_combined_map(
-            ssh_attacks, ssh_successful, op_entries, 
-            active_ssh, active_web
-        )
+        # Serve the cached render for this marker set (re-rendered off the request thread)
+        markers = build_map_markers(ssh_attacks, ssh_successful, op_entries, active_ssh, active_web)
+        map_html = map_renders.get(tuple(sorted(set(hide_params))), markers)
         return jsonify({'map_html': map_html})
     except Exception as e:
         logging.error(f"Error in map API: {e}")
@@ -1246,99 +3468,36 @@ def api_map():
 def api_geo_data():
     """API endpoint for geographical data in JSON format for React frontend"""
     try:
-        ssh_entries = get_ssh_log_entries(24)
-        op_entries, _ = get_openproject_logs(24)
+        zoom, bbox = parse_geo_view(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        ssh_entries = collectors.get('ssh_entries')
+        op_entries, _ = collectors.get('openproject_logs')
         
         ssh_attacks = [e for e in ssh_entries if e['type'] == 'attack']
         ssh_successful = [e for e in ssh_entries if e['type'] == 'success']
         
-        active_ssh = get_active_ssh_sessions()
-        active_web = get_active_web_connections()
-        
-        geo_data = []
-        
-        # SSH Successful connections
-        for entry in ssh_successful:
-            ip = entry.get('ip', 'unknown')
-            geo_info = get_geo_info(ip)
-            if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                geo_data.append({
-                    'lat': geo_info['lat'],
-                    'lon': geo_info['lon'],
-                    'type': 'ssh_success',
-                    'country': geo_info['country'],
-                    'city': geo_info['city'],
-                    'ip': ip,
-                    'description': f"SSH Exitosa desde {ip}",
-                    'color': 'green',
-                    'count': 1
-                })
+        active_ssh = collectors.get('active_ssh')
+        active_web = collectors.get('active_web')
         
-        # SSH Attacks
-        for entry in ssh_attacks:
-            ip = entry.get('ip', 'unknown')
-            geo_info = get_geo_info(ip)
+        layers = [
+            (ssh_successful, 'ssh_success', 'ip'),
+            (ssh_attacks, 'ssh_attack', 'ip'),
+            (op_entries, 'openproject', 'ip'),
+            (active_web, 'web_active', 'remote_ip'),
+        ]
+        # Count events per (IP, type) first: clustering then scales with distinct IPs
+        ip_counts = Counter((entry.get(ip_key), marker_type)
+                            for entries, marker_type, ip_key in layers for entry in entries)
+        ip_info = enrich_ips(ip for ip, _ in ip_counts)
+        points = []
+        for (ip, marker_type), count in ip_counts.items():
+            geo_info = ip_info.get(ip, UNKNOWN_IP_INFO)
             if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                geo_data.append({
-                    'lat': geo_info['lat'],
-                    'lon': geo_info['lon'],
-                    'type': 'ssh_attack',
-                    'country': geo_info['country'],
-                    'city': geo_info['city'],
-                    'ip': ip,
-                    'description': f"Ataque SSH desde {ip}",
-                    'color': 'red',
-                    'count': 1
-                })
-        
-        # OpenProject entries
-        for entry in op_entries:
-            ip = entry.get('ip', 'unknown')
-            if ip and ip != 'unknown':
-                geo_info = get_geo_info(ip)
-                if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                    geo_data.append({
-                        'lat': geo_info['lat'],
-                        'lon': geo_info['lon'],
-                        'type': 'openproject',
-                        'country': geo_info['country'],
-                        'city': geo_info['city'],
-                        'ip': ip,
-                        'description': f"OpenProject desde {ip}",
-                        'color': 'orange',
-                        'count': 1
-                    })
-        
-        # Active web connections
-        for connection in active_web:
-            ip = connection.get('ip', 'unknown')
-            if ip and ip != 'unknown':
-                geo_info = get_geo_info(ip)
-                if geo_info['lat'] != 0 and geo_info['lon'] != 0:
-                    geo_data.append({
-                        'lat': geo_info['lat'],
-                        'lon': geo_info['lon'],
-                        'type': 'web_active',
-                        'country': geo_info['country'],
-                        'city': geo_info['city'],
-                        'ip': ip,
-                        'description': f"Conexión Web Activa desde {ip}",
-                        'color': 'blue',
-                        'count': 1
-                    })
-        
-        # Consolidar entradas duplicadas por ubicación
-        consolidated_data = {}
-        for item in geo_data:
-            key = f"{item['lat']},{item['lon']},{item['type']}"
-            if key in consolidated_data:
-                consolidated_data[key]['count'] += 1
-                consolidated_data[key]['description'] += f" (+{consolidated_data[key]['count']})"
-            else:
-                consolidated_data[key] = item
-        
-        return jsonify(list(consolidated_data.values()))
+                points.append((geo_info['lat'], geo_info['lon'], marker_type, ip, geo_info['country'], count))
         
+        return jsonify(cluster_geo_points(points, zoom, bbox))
     except Exception as e:
         logging.error(f"Error in geo-data API: {e}")
         return jsonify([])
@@ -1348,7 +3507,7 @@ def api_geo_data():
 def api_openproject_failed_logins():
     """API endpoint for OpenProject failed login attempts"""
     try:
-        failed_logins = get_openproject_failed_logins(24)
+        failed_logins = collectors.get('op_failed_logins')
         return jsonify(failed_logins)
     except Exception as e:
         logging.error(f"Error in OpenProject failed logins API: {e}")
@@ -1358,7 +3517,7 @@ def api_openproject_failed_logins():
 def api_openproject_successful_logins():
     """API endpoint for OpenProject successful logins"""
     try:
-        successful_logins = get_openproject_successful_logins(24)
+        successful_logins = collectors.get('op_successful_logins')
         return jsonify(successful_logins)
     except Exception as e:
         logging.error(f"Error in OpenProject successful logins API: {e}")
@@ -1368,7 +3527,7 @@ def api_openproject_successful_logins():
 def api_openproject_active_users():
     """API endpoint for currently active OpenProject users"""
     try:
-        active_users = get_openproject_active_users(1)
+        active_users = collectors.get('op_active_users')
         return jsonify(active_users)
     except Exception as e:
         logging.error(f"Error in OpenProject active users API: {e}")
@@ -1378,7 +3537,7 @@ def api_openproject_active_users():
 def api_openproject_users_db():
     """API endpoint for valid OpenProject users from database (filters out demo/invalid users)"""
     try:
-        users = get_openproject_users_from_db()
+        users = collectors.get('op_users_db')
         users_list = list(users.values())
         
         # Filter out invalid/demo users
@@ -1401,55 +3560,567 @@ def api_openproject_users_db():
         logging.error(f"Error in OpenProject users DB API: {e}")
         return jsonify([])
 
+METRICS_SAMPLE_INTERVAL = 5            # Seconds between samples
+METRICS_HISTORY_SECONDS = 24 * 3600    # Ring buffer span (17280 samples)
+METRICS_HISTORY_POINTS = 120           # Default points per downsampled series
+METRICS_FIELDS = ('cpu', 'memory', 'disk', 'load', 'connections')
+
+class MetricsRing:
+    """Fixed-size ring buffer of samples: one array('d') per field plus timestamps"""
+
+    def __init__(self, capacity, fields=METRICS_FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in fields}
+        self.head = 0   # Next slot to write
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, ts, values):
+        with self.lock:
+            self.timestamps[self.head] = ts
+            for field in self.fields:
+                self.columns[field][self.head] = values[field]
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def latest(self):
+        with self.lock:
+            if not self.size:
+                return None
+            i = (self.head - 1) % self.capacity
+            return {'ts': self.timestamps[i], **{field: self.columns[field][i] for field in self.fields}}
+
+    def window(self, since):
+        """(timestamps, {field: values}) of the samples taken at or after `since`, oldest first"""
+        with self.lock:
+            start = (self.head - self.size) % self.capacity
+            order = [i for i in ((start + k) % self.capacity for k in range(self.size)) if self.timestamps[i] >= since]
+            return ([self.timestamps[i] for i in order],
+                    {field: [self.columns[field][i] for i in order] for field in self.fields})
+
+class MetricsSampler:
+    """Samples CPU, memory, disk, load and socket count at a fixed cadence.
+
+    cpu_percent(interval=None) measures the time since the previous sample, so
+    nothing blocks: /api/server/status answers from the latest sample instead
+    of sleeping a second in psutil.cpu_percent(interval=1).
+    """
+
+    def __init__(self, interval=METRICS_SAMPLE_INTERVAL, history_seconds=METRICS_HISTORY_SECONDS):
+        self.interval = interval
+        self.ring = MetricsRing(history_seconds // interval)
+
+    @staticmethod
+    def _disk_percent():
+        disk = psutil.disk_usage('/')
+        return (disk.used / disk.total) * 100
+
+    def sample(self):
+        values = {
+            # The very first sample has no previous one to measure from: take a short 0.1s reading
+            'cpu': psutil.cpu_percent(interval=None if self.ring.size else 0.1),
+            'memory': psutil.virtual_memory().percent,
+            'disk': self._disk_percent(),
+            'load': os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0,
+            'connections': count_inet_sockets(),
+        }
+        self.ring.append(time.time(), values)
+        return values
+
+    def latest(self):
+        """Most recent sample, taking one now if the buffer is empty or stale (no sampler thread)"""
+        latest = self.ring.latest()
+        if latest is None or time.time() - latest['ts'] > 2 * self.interval:
+            collectors.get('metrics_sample')
+            latest = self.ring.latest()
+        return latest
+
+    def history(self, seconds, points=METRICS_HISTORY_POINTS):
+        """Series over the last `seconds`, averaged into at most `points` buckets (plus per-bucket max)"""
+        now = time.time()
+        timestamps, columns = self.ring.window(now - seconds)
+        step = max(seconds / points, self.interval)
+        buckets = OrderedDict()
+        for i, ts in enumerate(timestamps):
+            buckets.setdefault(int((ts - (now - seconds)) // step), []).append(i)
+        series = {'timestamps': [round(now - seconds + (b + 1) * step, 3) for b in buckets]}
+        for field in METRICS_FIELDS:
+            values = columns[field]
+            series[field] = [round(sum(values[i] for i in idx) / len(idx), 2) for idx in buckets.values()]
+            series[f"{field}_max"] = [round(max(values[i] for i in idx), 2) for idx in buckets.values()]
+        return {'range_seconds': seconds, 'step_seconds': step, 'interval_seconds': self.interval,
+                'points': len(buckets), **series}
+
+metrics_sampler = MetricsSampler()
+
+def parse_duration(value, default):
+    """Parse '90', '15m', '6h' or '1d' into seconds"""
+    if not value:
+        return default
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd]?)', value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+def get_metric_status(value, warning_threshold=70, critical_threshold=90):
+    if value >= critical_threshold:
+        return 'critical'
+    elif value >= warning_threshold:
+        return 'warning'
+    else:
+        return 'good'
+
+def build_metrics(sample):
+    """Status-page metrics block from one sample"""
+    return {
+        'cpu': {
+            'value': round(sample['cpu'], 1),
+            'status': get_metric_status(sample['cpu'])
+        },
+        'memory': {
+            'value': round(sample['memory'], 1),
+            'status': get_metric_status(sample['memory'])
+        },
+        'disk': {
+            'value': round(sample['disk'], 1),
+            'status': get_metric_status(sample['disk'])
+        },
+        'load': {
+            'value': round(sample['load'], 2),
+            'status': get_metric_status(sample['load'] * 100, 70, 90)
+        }
+    }
+
+SERVICE_UNITS = ['ssh', 'nginx', 'systemd-resolved', 'cron']  # Key services to monitor
+STATUS_PROBE_WORKERS = 8
+STATUS_PROBE_DEADLINE = 6  # Seconds for a whole round of probes; stragglers are reported as unknown
+STATUS_PROBE_TIMEOUT = 4  # Subprocess/socket timeout inside each probe, so a hung one frees its worker
+
+status_probe_pool = ThreadPoolExecutor(max_workers=STATUS_PROBE_WORKERS, thread_name_prefix='status-probe')
+overdue_probes = set()  # Futures still running after their round's deadline (they cannot be cancelled)
+
+def run_probes(probes, deadline=STATUS_PROBE_DEADLINE):
+    """Run {key: callable} concurrently on the probe pool.
+
+    Returns {key: result}, with None for probes that raised or missed the
+    deadline, so a round takes as long as its slowest probe (at most
+    `deadline`) instead of the sum of all of them. Probes bound their own
+    work with STATUS_PROBE_TIMEOUT; one already running past the deadline
+    keeps its worker and is tracked in `overdue_probes`.
+    """
+    futures = {status_probe_pool.submit(func): key for key, func in probes.items()}
+    _, pending = wait(futures, timeout=deadline)
+    results = {}
+    for future, key in futures.items():
+        if future in pending:
+            results[key] = None
+            if future.cancel():  # Only succeeds while still queued
+                logging.warning(f"Status probe {key} skipped: the {deadline}s deadline passed before it started")
+                continue
+            overdue_probes.add(future)
+            future.add_done_callback(overdue_probes.discard)
+            logging.warning(f"Status probe {key} missed the {deadline}s deadline and is still running "
+                            f"({len(overdue_probes)} overdue)")
+        elif future.exception() is not None:
+            logging.error(f"Status probe {key} failed: {future.exception()}")
+            results[key] = None
+        else:
+            results[key] = future.result()
+    return results
+
+MONITORED_UNITS = os.environ.get('MONITORED_UNITS', ','.join(SERVICE_UNITS + ['fail2ban'])).split(',')
+UNIT_PROPERTIES = ['Id', 'LoadState', 'ActiveState', 'SubState', 'StateChangeTimestampMonotonic']
+UNIT_TRANSIENT_STATES = {'activating', 'deactivating', 'reloading'}  # Not reported as flips
+
+def _monotonic_to_epoch(usec):
+    """systemd CLOCK_MONOTONIC microseconds -> wall-clock epoch (None if never set)"""
+    if not usec:
+        return None
+    return time.time() - (time.monotonic() - usec / 1e6)
+
+def query_unit_states(units):
+    """State of every unit from a single `systemctl show` call.
+
+    Returns {unit: {'id', 'load_state', 'active_state', 'sub_state', 'since'}}
+    where `since` is the epoch of the last state change. systemctl prints
+    one property block per unit, in argument order, separated by blank lines.
+    """
+    result = timed_run(['systemctl', 'show', '--no-pager', '-p', ','.join(UNIT_PROPERTIES), '--', *units],
+                       capture_output=True, text=True, timeout=STATUS_PROBE_TIMEOUT)
+    if result.returncode != 0 and not result.stdout:
+        raise RuntimeError(result.stderr.strip() or f"systemctl show exited with {result.returncode}")
+    blocks = [dict(line.split('=', 1) for line in block.splitlines() if '=' in line)
+              for block in result.stdout.strip().split('\n\n')]
+    states = {}
+    for unit, props in zip(units, blocks):
+        try:
+            since = _monotonic_to_epoch(int(props.get('StateChangeTimestampMonotonic') or 0))
+        except ValueError:
+            since = None
+        states[unit] = {
+            'id': props.get('Id', unit),
+            'load_state': props.get('LoadState', 'unknown'),
+            'active_state': props.get('ActiveState', 'unknown'),
+            'sub_state': props.get('SubState', 'unknown'),
+            'since': since
+        }
+    return states
+
+class UnitStateWatcher:
+    """Cached systemd unit states, refreshed by unit events instead of polling.
+
+    One `systemctl show` seeds the cache. After that a long-lived
+    `journalctl -f` filtered to PID 1 messages about the watched units
+    (Started/Stopped/Failed...) wakes the watcher, which re-reads only that
+    unit and stores a 'unit_state' event when its ActiveState flips between
+    stable states. While the follower is not connected (no journal access,
+    or imported by another process) states() falls back to the batch query.
+    """
+
+    def __init__(self, units=MONITORED_UNITS):
+        self.units = list(units)
+        self.states_by_unit = {}
+        self.stable_states = {}  # unit -> last non-transient ActiveState, to detect flips
+        self.lock = threading.Lock()
+        self.connected = False
+        self.thread = None
+        self.process = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start the follower thread (idempotent)"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='unit-state-watcher', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.process is not None:
+            self.process.terminate()
+
+    def refresh(self, units=None):
+        """Re-read `units` (default: all) and record flips; returns the full state map"""
+        fresh = query_unit_states(units or self.units)
+        flips = []
+        with self.lock:
+            for unit, state in fresh.items():
+                self.states_by_unit[unit] = state
+                if state['active_state'] in UNIT_TRANSIENT_STATES:
+                    continue
+                previous = self.stable_states.get(unit)
+                self.stable_states[unit] = state['active_state']
+                if previous is not None and previous != state['active_state']:
+                    flips.append({
+                        'ts': state['since'] or time.time(), 'event_type': 'unit_state', 'source': 'systemd',
+                        'ip': None, 'country': None,
+                        'data': {'unit': unit, 'from': previous, 'to': state['active_state'],
+                                 'sub_state': state['sub_state']}
+                    })
+            states = dict(self.states_by_unit)
+        if flips:
+            event_store.add_events(flips)
+        return states
+
+    def states(self):
+        """Latest state of every watched unit"""
+        self.start()
+        if self.connected and len(self.states_by_unit) == len(self.units):
+            with self.lock:
+                return dict(self.states_by_unit)
+        return self.refresh()
+
+    def _run(self):
+        backoff = 5
+        while not self.stop_event.is_set():
+            try:
+                self._follow()  # Returns when journalctl exits
+                backoff = 5
+            except Exception as e:
+                logging.error(f"Unit state watcher interrupted: {e}")
+                backoff = min(backoff * 2, 60)
+            self.connected = False
+            self.stop_event.wait(backoff)
+
+    def _follow(self):
+        ids = {state['id']: unit for unit, state in self.refresh().items()}
+        cmd = ['journalctl', '--follow', '--lines=0', '--no-pager', '-o', 'json', '--output-fields=UNIT', '_PID=1']
+        cmd += [f'UNIT={unit_id}' for unit_id in ids]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            # Changes between the seed query and the follower attaching are picked up here
+            self.refresh()
+            self.connected = True
+            for line in self.process.stdout:
+                try:
+                    unit = ids.get(json.loads(line).get('UNIT'))
+                except ValueError:
+                    continue
+                if unit is not None:
+                    self.refresh([unit])
+        finally:
+            self.process.kill()
+            self.process.wait()
+
+unit_states = UnitStateWatcher()
+
+DOCKER_INVENTORY_INTERVAL = 15  # Seconds between stats samples; state changes arrive on the events stream
+DOCKER_EVENT_ACTIONS = ['create', 'destroy', 'die', 'health_status', 'kill', 'oom', 'pause', 'rename',
+                        'restart', 'start', 'stop', 'unpause', 'update']
+EMPTY_DOCKER_STATUS = {'running': 0, 'total': 0, 'containers': []}
+
+def _container_role(name):
+    """Short label for the dashboard from the container name"""
+    name = name.lower()
+    if 'openproject' in name:
+        return 'Principal'
+    if 'postgres' in name or 'db' in name:
+        return 'Base de datos'
+    if 'monitor' in name or 'ssh' in name:
+        return 'Este sistema'
+    return 'Servicio'
+
+class DockerInventory:
+    """Container inventory from the Docker Engine API, shared by every status route.
+
+    A collector run lists all containers once per interval and samples
+    CPU/memory of the running ones with one-shot /stats calls on the probe
+    pool; CPU percent is the delta against the previous sample. Name, state,
+    health and restart count come from /containers/{id}/json and are kept
+    current by a follower of /events, which re-inspects only the container
+    an event is about. While the follower is disconnected every run
+    re-inspects all containers.
+    """
+
+    def __init__(self, socket_path=DOCKER_SOCKET_PATH):
+        self.socket_path = socket_path
+        self.containers = {}   # id -> container dict
+        self.cpu_samples = {}  # id -> (container total_usage, system_cpu_usage)
+        self.current = None    # Latest summary, replaced atomically
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()  # Serialises collector runs and event updates
+        self.connected = False
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start the events follower thread (idempotent)"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='docker-events', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _inspect(self, container_id):
+        info = docker_api_get(f"/containers/{container_id}/json", self.socket_path, timeout=STATUS_PROBE_TIMEOUT)
+        state = info.get('State') or {}
+        name = info.get('Name', '').lstrip('/')
+        return {
+            'id': info['Id'][:12],
+            'name': name,
+            'image': (info.get('Config') or {}).get('Image'),
+            'status': state.get('Status', 'unknown'),
+            'health': (state.get('Health') or {}).get('Status'),
+            'restart_count': info.get('RestartCount', 0),
+            'info': _container_role(name)
+        }
+
+    def _stats(self, container_id):
+        stats = docker_api_get(f"/containers/{container_id}/stats?stream=false&one-shot=true", self.socket_path,
+                               timeout=STATUS_PROBE_TIMEOUT)
+        cpu = stats.get('cpu_stats') or {}
+        usage = cpu.get('cpu_usage') or {}
+        memory = stats.get('memory_stats') or {}
+        memory_detail = memory.get('stats') or {}
+        # Page cache is reclaimable: subtract it as `docker stats` does (cgroup v2 / v1 key)
+        used = memory.get('usage', 0) - memory_detail.get('inactive_file', memory_detail.get('cache', 0))
+        return {
+            'cpu_total': usage.get('total_usage', 0),
+            'cpu_system': cpu.get('system_cpu_usage', 0),
+            'online_cpus': cpu.get('online_cpus') or len(usage.get('percpu_usage') or []) or 1,
+            'memory': max(used, 0),
+            'memory_limit': memory.get('limit', 0)
+        }
+
+    def _apply_stats(self, container_id, container, stats):
+        if stats is None:
+            self.cpu_samples.pop(container_id, None)
+            return {**container, 'cpu': None, 'memory': None, 'memory_limit': None, 'memory_percent': None}
+        previous = self.cpu_samples.get(container_id)
+        self.cpu_samples[container_id] = (stats['cpu_total'], stats['cpu_system'])
+        cpu_percent = None
+        if previous and stats['cpu_system'] > previous[1]:
+            cpu_percent = round((stats['cpu_total'] - previous[0]) / (stats['cpu_system'] - previous[1])
+                                * stats['online_cpus'] * 100, 1)
+        limit = stats['memory_limit']
+        return {
+            **container,
+            'cpu': cpu_percent,
+            'memory': stats['memory'],
+            'memory_limit': limit,
+            'memory_percent': round(stats['memory'] / limit * 100, 1) if limit else None
+        }
+
+    def _publish(self):
+        containers = sorted(self.containers.values(), key=lambda c: (c['status'] != 'running', c['name']))
+        self.current = {
+            'running': sum(1 for c in containers if c['status'] == 'running'),
+            'total': len(containers),
+            'containers': containers,
+            'updated_at': time.time()
+        }
+        return self.current
+
+    def refresh(self):
+        """List containers, sample stats of the running ones and publish (collector)"""
+        listing = docker_api_get('/containers/json?all=1', self.socket_path)
+        with self.refresh_lock:
+            ids = [c['Id'] for c in listing]
+            probes = {('stats', c['Id']): partial(self._stats, c['Id']) for c in listing if c.get('State') == 'running'}
+            for container_id in ids:
+                if not self.connected or container_id not in self.containers:
+                    probes[('inspect', container_id)] = partial(self._inspect, container_id)
+            results = run_probes(probes)
+            containers = {}
+            for c in listing:
+                container_id = c['Id']
+                container = results.get(('inspect', container_id)) or self.containers.get(container_id)
+                if container is None:
+                    name = (c.get('Names') or ['/' + container_id[:12]])[0].lstrip('/')
+                    container = {'id': container_id[:12], 'name': name, 'image': c.get('Image'), 'health': None,
+                                 'restart_count': None, 'info': _container_role(name)}
+                container = {**container, 'status': c.get('State', container.get('status', 'unknown'))}
+                containers[container_id] = self._apply_stats(container_id, container, results.get(('stats', container_id)))
+            for container_id in set(self.cpu_samples) - set(ids):
+                del self.cpu_samples[container_id]
+            self.containers = containers
+            return self._publish()
+
+    def apply_event(self, event):
+        """Re-inspect the container a /events message is about"""
+        container_id = event.get('id') or (event.get('Actor') or {}).get('ID')
+        if not container_id:
+            return
+        action = event.get('Action') or event.get('status') or ''
+        with self.refresh_lock:
+            if action == 'destroy':
+                self.containers.pop(container_id, None)
+                self.cpu_samples.pop(container_id, None)
+            else:
+                container = {**self.containers.get(container_id, {}), **self._inspect(container_id)}
+                if container['status'] != 'running':
+                    container = self._apply_stats(container_id, container, None)
+                self.containers[container_id] = container
+            self._publish()
+
+    def get(self):
+        """Latest inventory ({'running', 'total', 'containers'})"""
+        self.start()
+        current = self.current
+        if current is None:
+            collectors.get('docker_inventory')
+            current = self.current or {**EMPTY_DOCKER_STATUS, 'updated_at': 0}
+        if has_request_context():
+            g.data_updated_at = max(g.get('data_updated_at', 0), current['updated_at'])
+        return {key: current[key] for key in ('running', 'total', 'containers')}
+
+    def _run(self):
+        backoff = 5
+        while not self.stop_event.is_set():
+            try:
+                self._follow()  # Returns when the daemon closes the stream
+                backoff = 5
+            except Exception as e:
+                logging.error(f"Docker events stream interrupted: {e}")
+                backoff = min(backoff * 2, 60)
+            self.connected = False
+            self.stop_event.wait(backoff)
+
+    def _follow(self):
+        query = urllib.parse.urlencode({'filters': json.dumps({'type': ['container'], 'event': DOCKER_EVENT_ACTIONS})})
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request('GET', f"/events?{query}")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"events request returned {response.status}")
+            self.refresh()  # Catch up on whatever happened while disconnected
+            self.connected = True
+            for raw_line in iter(response.readline, b''):
+                try:
+                    event = json.loads(raw_line)
+                except ValueError:
+                    continue
+                try:
+                    self.apply_event(event)
+                except Exception as e:
+                    logging.error(f"Error applying Docker event: {e}")
+        finally:
+            conn.close()
+
+docker_inventory = DockerInventory()
+
 def get_docker_status():
-    """Get Docker containers status"""
+    """Docker containers status from the shared inventory"""
     try:
-        result = subprocess.run(['docker', 'ps', '-a', '--format', 'json'], 
-                              capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            containers = []
-            for line in result.stdout.strip().split('\n'):
-                if line:
-                    containers.append(json.loads(line))
-            
-            running = len([c for c in containers if c.get('State') == 'running'])
-            total = len(containers)
-            return {'running': running, 'total': total, 'containers': containers}
-        else:
-            return {'running': 0, 'total': 0, 'containers': []}
+        return docker_inventory.get()
     except Exception as e:
         logging.error(f"Error getting Docker status: {e}")
-        return {'running': 0, 'total': 0, 'containers': []}
+        return dict(EMPTY_DOCKER_STATUS)
+
+def _ufw_state():
+    result = timed_run(['ufw', 'status'], capture_output=True, text=True, timeout=STATUS_PROBE_TIMEOUT)
+    return 'active' if 'Status: active' in result.stdout else 'inactive'
+
+def _iptables_has_rules():
+    result = timed_run(['iptables', '-L', 'INPUT', '-n'], capture_output=True, text=True, timeout=STATUS_PROBE_TIMEOUT)
+    return len(result.stdout.strip().split('\n')) > 3  # Más de header
 
-def get_services_status():
+def probe_server_state(units=MONITORED_UNITS, firewall=True):
+    """One concurrent round of the status probes (unit states, firewall)"""
+    probes = {'units': unit_states.states}
+    if firewall:
+        probes['ufw'] = _ufw_state
+        probes['iptables'] = _iptables_has_rules
+    results = run_probes(probes)
+    states = results.pop('units') or {}
+    for unit in units:
+        state = states.get(unit)
+        results[f"unit:{unit}"] = state['active_state'] if state else None
+    return results
+
+def get_services_status(probes=None):
     """Get system services status"""
     try:
-        # Key services to monitor
-        key_services = ['ssh', 'nginx', 'systemd-resolved', 'cron']
+        if probes is None:
+            probes = probe_server_state(SERVICE_UNITS, firewall=False)
         
         active_services = 0
         services_detail = []
         
-        for service in key_services:
-            try:
-                result = subprocess.run(['systemctl', 'is-active', service], 
-                                      capture_output=True, text=True, timeout=5)
-                is_active = result.stdout.strip() == 'active'
-                services_detail.append({
-                    'name': service,
-                    'status': 'active' if is_active else 'inactive'
-                })
-                if is_active:
-                    active_services += 1
-            except:
+        for service in SERVICE_UNITS:
+            state = probes.get(f"unit:{service}")
+            if state is None:
                 services_detail.append({
                     'name': service,
                     'status': 'unknown'
                 })
+                continue
+            is_active = state == 'active'
+            services_detail.append({
+                'name': service,
+                'status': 'active' if is_active else 'inactive'
+            })
+            if is_active:
+                active_services += 1
         
         return {
             'active': active_services,
-            'total': len(key_services),
+            'total': len(SERVICE_UNITS),
             'services': services_detail
         }
     except Exception as e:
@@ -1460,7 +4131,16 @@ def get_services_status():
 def api_server_status():
     """API endpoint for real-time server status"""
     try:
-        status = get_system_status()
+        status = collectors.get('system_status')
+        # Metrics come from the latest sample (seconds old), the rest from the slower status collector
+        sample = metrics_sampler.latest()
+        status = {
+            **status,
+            'metrics': build_metrics(sample),
+            'lastUpdate': datetime.fromtimestamp(sample['ts']).strftime('%H:%M:%S'),
+            'system': {**status['system'], 'docker': get_docker_status(),
+                       'activeConnections': int(sample['connections'])}
+        }
         logging.info(f"Server status API called - CPU: {status['metrics']['cpu']['value']}%, Memory: {status['metrics']['memory']['value']}%, Disk: {status['metrics']['disk']['value']}%")
         return jsonify(status)
     except Exception as e:
@@ -1478,22 +4158,37 @@ def api_server_status():
             'system': {'docker': {'containers': [], 'running': 0, 'total': 0}, 'lastBackup': 'Unknown', 'activeConnections': 0}
         })
 
+@app.route('/api/server/units')
+def api_server_units():
+    """API endpoint for the state of every monitored systemd unit"""
+    try:
+        now = time.time()
+        return jsonify([{**state, 'unit': unit, 'seconds_in_state': round(now - state['since']) if state['since'] else None}
+                        for unit, state in unit_states.states().items()])
+    except Exception as e:
+        logging.error(f"Error in server units API: {e}")
+        return jsonify([])
+
+@app.route('/api/server/history')
+def api_server_history():
+    """API endpoint for downsampled CPU/memory/disk/load/connection series (sparklines)"""
+    try:
+        seconds = min(parse_duration(request.args.get('range'), 3600), METRICS_HISTORY_SECONDS)
+        points = max(1, min(request.args.get('points', METRICS_HISTORY_POINTS, type=int), 1000))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    metrics_sampler.latest()  # Make sure there is at least one sample
+    return jsonify(metrics_sampler.history(seconds, points))
+
 def get_system_info():
     """Get real system information"""
     try:
-        # CPU usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        
-        # Memory usage
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
-        
-        # Disk usage
-        disk = psutil.disk_usage('/')
-        disk_percent = disk.percent
-        
-        # Load average
-        load_avg = os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0
+        # CPU, memory, disk and load from the latest background sample
+        sample = metrics_sampler.latest()
+        cpu_percent = sample['cpu']
+        memory_percent = sample['memory']
+        disk_percent = sample['disk']
+        load_avg = sample['load']
         
         # Uptime
         boot_time = psutil.boot_time()
@@ -1524,38 +4219,38 @@ def get_system_info():
             'uptime': 'Unknown'
         }
 
-def get_security_services():
+def get_security_services(probes=None):
     """Check security services status"""
+    if probes is None:
+        probes = probe_server_state(['ssh', 'fail2ban'])
     services = []
     
     # SSH service
-    try:
-        result = subprocess.run(['systemctl', 'is-active', 'ssh'], 
-                              capture_output=True, text=True, timeout=5)
-        ssh_status = 'active' if result.stdout.strip() == 'active' else 'inactive'
+    ssh_state = probes.get('unit:ssh')
+    if ssh_state is not None:
+        ssh_status = 'active' if ssh_state == 'active' else 'inactive'
         services.append({
             'name': 'SSH',
             'status': ssh_status,
             'info': 'Puerto 22'
         })
-    except:
+    else:
         services.append({'name': 'SSH', 'status': 'unknown', 'info': 'Error'})
     
     # Fail2Ban
-    try:
-        result = subprocess.run(['systemctl', 'is-active', 'fail2ban'], 
-                              capture_output=True, text=True, timeout=5)
-        fail2ban_status = 'active' if result.stdout.strip() == 'active' else 'inactive'
+    fail2ban_state = probes.get('unit:fail2ban')
+    if fail2ban_state is not None:
+        fail2ban_status = 'active' if fail2ban_state == 'active' else 'inactive'
         services.append({
             'name': 'Fail2Ban',
             'status': fail2ban_status,
             'info': 'Protección activa' if fail2ban_status == 'active' else 'Desactivado'
         })
-    except:
+    else:
         services.append({'name': 'Fail2Ban', 'status': 'inactive', 'info': 'No instalado'})
     
     # GeoIP (check if database exists)
-    geoip_status = 'active' if os.path.exists('/opt/ssh-monitor/GeoLite2-City.mmdb') else 'inactive'
+    geoip_status = 'active' if os.path.exists(GEOIP_DB_PATH) else 'inactive'
     services.append({
         'name': 'GeoIP',
         'status': geoip_status,
@@ -1563,98 +4258,54 @@ def get_security_services():
     })
     
     # UFW Firewall - verificar estado REAL
-    try:
-        result = subprocess.run(['ufw', 'status'], 
-                              capture_output=True, text=True, timeout=5)
-        ufw_status = 'active' if 'Status: active' in result.stdout else 'inactive'
+    ufw_status = probes.get('ufw')
+    if ufw_status is not None:
         services.append({
             'name': 'Firewall (UFW)',
             'status': ufw_status,
             'info': 'Protección activa' if ufw_status == 'active' else 'Desactivado'
         })
-    except:
+    else:
         services.append({'name': 'Firewall (UFW)', 'status': 'inactive', 'info': 'No disponible'})
     
     # iptables rules - verificar si hay reglas
-    try:
-        result = subprocess.run(['iptables', '-L', 'INPUT', '-n'], 
-                              capture_output=True, text=True, timeout=5)
-        iptables_rules = len(result.stdout.strip().split('\n')) > 3  # Más de header
+    iptables_rules = probes.get('iptables')
+    if iptables_rules is not None:
         services.append({
             'name': 'iptables',
             'status': 'active' if iptables_rules else 'inactive',
             'info': f'{"Reglas activas" if iptables_rules else "Sin reglas"}'
         })
-    except:
+    else:
         services.append({'name': 'iptables', 'status': 'unknown', 'info': 'No verificable'})
     
-
-    
     return services
 
-def get_docker_info():
-    """Get Docker containers information"""
-    containers = []
+def get_last_apt_update():
+    """Human-readable age of the last apt run, from /var/log/apt/history.log's mtime"""
     try:
-        # Get running containers
-        result = subprocess.run(['docker', 'ps', '--format', 'table {{.Names}}\t{{.Status}}'],
-                              capture_output=True, text=True, timeout=10)
-        
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')[1:]  # Skip header
-            for line in lines:
-                if line.strip():
-                    parts = line.split('\t')
-                    if len(parts) >= 2:
-                        name = parts[0].strip()
-                        status_full = parts[1].strip()
-                        
-                        # Determine container importance and info
-                        if 'openproject' in name.lower():
-                            info = 'Principal'
-                        elif 'postgres' in name.lower() or 'db' in name.lower():
-                            info = 'Base de datos'
-                        elif 'monitor' in name.lower() or 'ssh' in name.lower():
-                            info = 'Este sistema'
-                        else:
-                            info = 'Servicio'
-                        
-                        containers.append({
-                            'name': name,
-                            'status': 'running',
-                            'info': info
-                        })
-        
-        # Get all containers (including stopped ones) for total count
-        result_all = subprocess.run(['docker', 'ps', '-a', '--format', 'table {{.Names}}'],
-                                  capture_output=True, text=True, timeout=10)
-        total_containers = 0
-        if result_all.returncode == 0:
-            lines = result_all.stdout.strip().split('\n')[1:]  # Skip header
-            total_containers = len([line for line in lines if line.strip()])
-            
-    except Exception as e:
-        logging.error(f"Error getting Docker info: {e}")
-    
-    return {
-        'containers': containers[:3],  # Solo mostrar los 3 más importantes
-        'running': len(containers),
-        'total': total_containers
-    }
+        update_date = datetime.fromtimestamp(os.stat('/var/log/apt/history.log').st_mtime).date()
+    except FileNotFoundError:
+        return 'Fecha no disponible'
+    except OSError:
+        return 'Error al verificar'
+    days_ago = (datetime.now().date() - update_date).days
+    if days_ago == 0:
+        return 'Hoy'
+    elif days_ago == 1:
+        return 'Ayer'
+    elif days_ago < 7:
+        return f'Hace {days_ago} días'
+    elif days_ago < 30:
+        return f'Hace {days_ago//7} semanas'
+    else:
+        return f'Hace {days_ago} días (⚠️ ANTIGUO)'
 
 def get_system_status():
     """Get comprehensive system status"""
     try:
-        # CPU usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        
-        # Memory usage
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
-        
-        # Disk usage
-        disk = psutil.disk_usage('/')
-        disk_percent = (disk.used / disk.total) * 100
+        # CPU, memory, disk, load and sockets from the latest background sample
+        sample = metrics_sampler.latest()
         
         # System uptime
         boot_time = psutil.boot_time()
@@ -1663,98 +4314,20 @@ def get_system_status():
         uptime_hours = int((uptime_seconds % 86400) // 3600)
         uptime = f'{uptime_days}d {uptime_hours}h' if uptime_days > 0 else f'{uptime_hours}h'
         
-        # System load
-        load_avg = os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0
-        
-        # Docker containers status
-        docker_containers = get_docker_status()
-        
-        # System services status
-        services = get_services_status()
-        
-        # Network connections
-        active_connections = len(psutil.net_connections(kind='inet'))
-        
-        # Get last Ubuntu update info
-        try:
-            result = subprocess.run(['stat', '-c', '%Y', '/var/log/apt/history.log'],
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                update_timestamp = int(result.stdout.strip())
-                update_date = datetime.fromtimestamp(update_timestamp)
-                days_ago = (datetime.now() - update_date).days
-                if days_ago == 0:
-                    last_update = 'Hoy'
-                elif days_ago == 1:
-                    last_update = 'Ayer'
-                else:
-                    last_update = f'Hace {days_ago} días'
-            else:
-                last_update = 'Desconocido'
-        except:
-            last_update = 'Desconocido'
-        
-        # Determine status levels
-        def get_metric_status(value, warning_threshold=70, critical_threshold=90):
-            if value >= critical_threshold:
-                return 'critical'
-            elif value >= warning_threshold:
-                return 'warning'
-            else:
-                return 'good'
+        # Service units and firewall probes run concurrently: the slowest one sets the pace
+        probes = probe_server_state(['ssh', 'fail2ban'])
         
         # Security services list - usar estado REAL
-        security_services = get_security_services()
+        security_services = get_security_services(probes)
         
-        # Obtener fecha REAL de última actualización de Ubuntu
-        try:
-            # Buscar última fecha en logs de apt
-            result = subprocess.run(['stat', '-c', '%y', '/var/log/apt/history.log'], 
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                last_update_raw = result.stdout.strip().split()[0]  # Solo la fecha
-                # Convertir a formato más legible
-                from datetime import datetime as dt
-                update_date = dt.strptime(last_update_raw, '%Y-%m-%d')
-                days_ago = (dt.now() - update_date).days
-                
-                if days_ago == 0:
-                    last_update = 'Hoy'
-                elif days_ago == 1:
-                    last_update = 'Ayer'
-                elif days_ago < 7:
-                    last_update = f'Hace {days_ago} días'
-                elif days_ago < 30:
-                    last_update = f'Hace {days_ago//7} semanas'
-                else:
-                    last_update = f'Hace {days_ago} días (⚠️ ANTIGUO)'
-            else:
-                last_update = 'Fecha no disponible'
-        except:
-            last_update = 'Error al verificar'
+        # Fecha REAL de última actualización de Ubuntu (mtime del log de apt)
+        last_update = get_last_apt_update()
         
         # Mock backup info (you can implement real backup checking here)
         last_backup = 'Ayer 02:00'  # This should be replaced with real backup check
         
         return {
-            'metrics': {
-                'cpu': {
-                    'value': round(cpu_percent, 1),
-                    'status': get_metric_status(cpu_percent)
-                },
-                'memory': {
-                    'value': round(memory_percent, 1),
-                    'status': get_metric_status(memory_percent)
-                },
-                'disk': {
-                    'value': round(disk_percent, 1),
-                    'status': get_metric_status(disk_percent)
-                },
-                'load': {
-                    'value': round(load_avg, 2),
-                    'status': get_metric_status(load_avg * 100, 70, 90)
-                }
-            },
+            'metrics': build_metrics(sample),
             'uptime': uptime,
             'lastUpdate': datetime.now().strftime('%H:%M:%S'),
             'security': {
@@ -1764,17 +4337,9 @@ def get_system_status():
                 'lastUpdate': last_update
             },
             'system': {
-                'docker': {
-                    'running': docker_containers['running'],
-                    'total': docker_containers['total'],
-                    'containers': [
-                        {'name': 'openproject', 'status': 'running', 'info': 'Principal'},
-                        {'name': 'postgresql', 'status': 'running', 'info': 'Base de datos'},
-                        {'name': 'monitoring', 'status': 'running', 'info': 'Este sistema'}
-                    ]
-                },
+                'docker': get_docker_status(),
                 'lastBackup': last_backup,
-                'activeConnections': active_connections
+                'activeConnections': int(sample['connections'])
             }
         }
     except Exception as e:
@@ -1796,17 +4361,37 @@ def get_system_status():
 def api_intrusion_detection():
     """API endpoint for security intrusion detection analysis"""
     try:
-        intrusion_data = detect_potential_intruders()
+        intrusion_data = dict(collectors.get('intrusion'))
         
-        # Inicializar alertas reales si no existen
-        if 'alerts' not in intrusion_data:
-            intrusion_data['alerts'] = []
+        # Alertas de fuerza bruta en vivo (más recientes primero) + anomalías de usuarios de OpenProject
+        intrusion_data['alerts'] = brute_force.alerts() + intrusion_data.get('alerts', [])
         
         return jsonify(intrusion_data)
     except Exception as e:
         logging.error(f"Error in intrusion detection API: {e}")
         return jsonify({'total_registered': 0, 'total_active': 0, 'alerts': []})
 
+# Background collectors: name -> function, refresh interval in seconds
+collectors.register('ssh_entries', lambda: get_ssh_log_entries(24), 15)
+collectors.register('tcp_connections', get_tcp_connections, 10)
+collectors.register('active_ssh', get_active_ssh_sessions, 15)
+collectors.register('active_web', get_active_web_connections, 15)
+collectors.register('fail2ban', get_fail2ban_status, 30)
+collectors.register('openproject_logs', lambda: get_openproject_logs(24), 30)
+collectors.register('op_failed_logins', lambda: get_openproject_failed_logins(24), 60)
+collectors.register('op_successful_logins', lambda: get_openproject_successful_logins(24), 120)
+collectors.register('op_active_users', lambda: get_openproject_active_users(1), 60)
+collectors.register('op_users_db', get_openproject_users_from_db, OPENPROJECT_USERS_CHECK_INTERVAL)
+collectors.register('intrusion', detect_potential_intruders, 60)
+collectors.register('metrics_sample', metrics_sampler.sample, METRICS_SAMPLE_INTERVAL)
+collectors.register('docker_inventory', docker_inventory.refresh, DOCKER_INVENTORY_INTERVAL)
+collectors.register('system_status', get_system_status, 30)
+collectors.register('event_store_purge', lambda: (event_store.purge(), rollups.purge()), 3600)
+
 if __name__ == '__main__':
     logging.info("Starting SSH + OpenProject Monitor Dashboard...")
+    collectors.start()
+    openproject_logs.start()
+    unit_states.start()
+    docker_inventory.start()
     app.run(host='0.0.0.0', port=8091, debug=False)